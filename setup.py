@@ -21,7 +21,7 @@ except ImportError:
 
 install_requires = [
    "wagtail>=1.4.0",
-   "Django>=1.7.1",
+   "Django>=1.8",
 ]
 
 # Testing dependencies
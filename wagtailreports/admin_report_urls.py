@@ -2,12 +2,18 @@ from __future__ import absolute_import, unicode_literals
 
 from django.conf.urls import url
 
-from wagtailreports.views import reports
+from wagtailreports.views import chooser, reports
 
 urlpatterns = [
     url(r'^$', reports.index, name='index'),
     url(r'^add/$', reports.add, name='add'),
     url(r'^edit/(\d+)/$', reports.edit, name='edit'),
     url(r'^delete/(\d+)/$', reports.delete, name='delete'),
+    url(r'^chooser/$', chooser.chooser, name='chooser'),
+    url(r'^chooser/(\d+)/$', chooser.report_chosen, name='report_chosen'),
+    url(r'^chooser/upload/$', chooser.chooser_upload, name='chooser_upload'),
+    url(r'^profile/(\d+)/$', reports.profile, name='profile'),
+    url(r'^fragment/(\d+)/$', reports.fragment, name='fragment'),
+    url(r'^metrics/$', reports.metrics_view, name='metrics'),
     # url(r'^usage/(\d+)/$', reports.usage, name='report_usage'),
 ]
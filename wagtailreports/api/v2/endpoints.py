@@ -11,8 +11,8 @@ class ReportsAPIEndpoint(BaseAPIEndpoint):
     base_serializer_class = ReportSerializer
     filter_backends = [FieldsFilter, OrderingFilter, SearchFilter]
     body_fields = BaseAPIEndpoint.body_fields + ['title']
-    meta_fields = BaseAPIEndpoint.meta_fields + ['tags', 'download_url']
-    listing_default_fields = BaseAPIEndpoint.listing_default_fields + ['title', 'tags', 'download_url']
+    meta_fields = BaseAPIEndpoint.meta_fields + ['download_url']
+    listing_default_fields = BaseAPIEndpoint.listing_default_fields + ['title', 'download_url']
     nested_default_fields = BaseAPIEndpoint.nested_default_fields + ['title', 'download_url']
     name = 'reports'
     model = get_report_model()
@@ -22,8 +22,8 @@ class ReportPanelsAPIEndpoint(BaseAPIEndpoint):
     base_serializer_class = ReportPanelSerializer
     filter_backends = [FieldsFilter, OrderingFilter, SearchFilter]
     body_fields = BaseAPIEndpoint.body_fields + ['title']
-    meta_fields = BaseAPIEndpoint.meta_fields + ['tags', 'download_url']
-    listing_default_fields = BaseAPIEndpoint.listing_default_fields + ['title', 'tags', 'download_url']
-    nested_default_fields = BaseAPIEndpoint.nested_default_fields + ['title', 'download_url']
+    meta_fields = BaseAPIEndpoint.meta_fields
+    listing_default_fields = BaseAPIEndpoint.listing_default_fields + ['title']
+    nested_default_fields = BaseAPIEndpoint.nested_default_fields + ['title']
     name = 'reportpanels'
     model = get_report_panel_model()
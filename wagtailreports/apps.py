@@ -7,3 +7,7 @@ class WagtailReportsAppConfig(AppConfig):
     name = 'wagtailreports'
     label = 'wagtailreports'
     verbose_name = "Wagtail reports"
+
+    def ready(self):
+        from wagtailreports.signal_handlers import register_signal_handlers
+        register_signal_handlers()
@@ -0,0 +1,167 @@
+from __future__ import absolute_import, unicode_literals
+
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+from wagtail.wagtailcore.models import Page, get_page_models
+
+from wagtailreports.models import get_report_model, get_report_panel_model
+from wagtailreports.utils import count_queries
+
+# Values a report can filter each flag on
+FLAG_VALUES = (None, True, False)
+FLAG_FIELDS = ('live', 'expired', 'locked', 'has_unpublished_changes')
+
+
+def generate_pages(number, seed=0, batch_size=1000):
+    """
+    Create ``number`` plain pages with a random mix of flags and dates
+    below a new page under the tree root. Paths are computed up front so the
+    pages can be bulk created, which is why they are all of the base page
+    model. Returns the parent page.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    root = Page.get_first_root_node()
+    parent = root.add_child(instance=Page(title="Benchmark pages", slug='benchmark-pages-%d' % seed, live=True))
+    content_type = ContentType.objects.get_for_model(Page)
+    try:
+        Page._meta.get_field('draft_title')
+        has_draft_title = True
+    except FieldDoesNotExist:
+        has_draft_title = False
+
+    def random_date():
+        if rng.random() < 0.5:
+            return None
+        return now + timedelta(minutes=rng.randint(-14 * 24 * 60, 14 * 24 * 60))
+
+    def build(index):
+        slug = 'page-%d' % index
+        page = Page(
+            title="Benchmark page %d" % index,
+            slug=slug,
+            content_type=content_type,
+            path=Page._get_path(parent.path, parent.depth + 1, index + 1),
+            depth=parent.depth + 1,
+            numchild=0,
+            url_path=parent.url_path + slug + '/',
+            live=rng.random() < 0.7,
+            expired=rng.random() < 0.1,
+            locked=rng.random() < 0.05,
+            has_unpublished_changes=rng.random() < 0.3,
+            go_live_at=random_date(),
+            expire_at=random_date(),
+        )
+        if has_draft_title:
+            page.draft_title = page.title
+        return page
+
+    for start in range(0, number, batch_size):
+        Page.objects.bulk_create([build(index) for index in range(start, min(start + batch_size, number))])
+    # Treebeard takes pages without children for leaves
+    parent.numchild = number
+    Page.objects.filter(pk=parent.pk).update(numchild=number)
+    return parent
+
+
+def get_content_types(labels=None):
+    """
+    Return the content types of the page models with the given
+    ``app_label.model`` labels, or of all page models starting with the base
+    page model the generated pages are of.
+    """
+    models = [Page] + [model for model in get_page_models() if model is not Page]
+    if labels:
+        labels = [label.lower() for label in labels]
+        models = [model for model in models if model._meta.label_lower in labels]
+    content_types = ContentType.objects.get_for_models(*models)
+    return [content_types[model] for model in models]
+
+
+def get_filter_combinations():
+    """
+    Yield a dict of report field values for every combination of flag
+    filters, and for each period of the go live and expiry dates.
+    """
+    for values in itertools.product(FLAG_VALUES, repeat=len(FLAG_FIELDS)):
+        yield dict(zip(FLAG_FIELDS, values))
+    Report = get_report_model()
+    for period, label in Report.PERIOD_CHOICES:
+        yield {'go_live_at': period}
+        yield {'expire_at': period}
+    yield {'query': "page 1"}
+
+
+def measure(function, repeat=3):
+    """
+    Call a function ``repeat`` times, returning the minimum, median and
+    maximum number of seconds it took and the number of queries it ran.
+    """
+    durations = []
+    for i in range(repeat):
+        with count_queries(connection) as queries:
+            start = time.time()
+            function()
+            durations.append(time.time() - start)
+    durations.sort()
+    return {
+        'min': durations[0],
+        'median': durations[len(durations) // 2],
+        'max': durations[-1],
+        'queries': queries['count'],
+    }
+
+
+def make_request(user, path='/', data=None):
+    request = RequestFactory().get(path, data or {})
+    request.user = user
+    return request
+
+
+def run(repeat=3, list_length=10, content_types=None):
+    """
+    Time report evaluation for every filter combination on each page content
+    type, the dashboard panel, the reports index and the chooser. Limit the
+    content types with a list of ``app_label.model`` labels. Returns a dict
+    of timings by name.
+    """
+    from wagtailreports.views import chooser, reports
+    from wagtailreports.wagtail_hooks import ReportPanel
+
+    Report = get_report_model()
+    timings = {}
+    content_types = get_content_types(content_types)
+
+    for content_type in content_types:
+        for values in get_filter_combinations():
+            name = 'results:%s:%s' % (
+                content_type.model,
+                ','.join('%s=%s' % item for item in sorted(values.items())),
+            )
+            # A new instance per call, as results are memoized per instance
+            timings[name] = measure(lambda: Report(
+                title="Benchmark", content_type=content_type, list_length=list_length, total_count=True, **values
+            ).results().evaluate(), repeat)
+
+    user = get_user_model().objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+    panel = get_report_panel_model().objects.create(title="Benchmark")
+    panel.for_users.add(user)
+    for content_type in content_types:
+        for live in (True, False):
+            panel.reports.add(Report.objects.create(
+                title="Benchmark", content_type=content_type, live=live, list_length=list_length, total_count=True,
+            ))
+
+    timings['dashboard'] = measure(lambda: ReportPanel(make_request(user)).render(), repeat)
+    timings['reports_index'] = measure(lambda: reports.index(make_request(user)), repeat)
+    timings['chooser'] = measure(lambda: chooser.chooser(make_request(user)), repeat)
+    return timings
@@ -0,0 +1,119 @@
+from __future__ import absolute_import, unicode_literals
+
+import time
+
+from django.conf import settings
+
+from wagtailreports import result_cache
+
+FAILURES_KEY = result_cache.CACHE_PREFIX + ':failures:%d'
+SUSPENDED_KEY = result_cache.CACHE_PREFIX + ':suspended:%d'
+
+
+def get_slow_threshold():
+    """
+    Number of milliseconds after which an evaluation counts as slow.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_SLOW_THRESHOLD', 5000)
+
+
+def get_failure_threshold():
+    """
+    Number of consecutive slow or timed out evaluations after which a
+    report is suspended, set ``WAGTAILREPORTS_SUSPEND_AFTER = 0`` to never
+    suspend reports.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_SUSPEND_AFTER', 3)
+
+
+def get_cooldown():
+    """
+    Number of seconds a report stays suspended.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_SUSPEND_FOR', 15 * 60)
+
+
+def is_failure(result):
+    # A batched result only has a share of the duration of its batch, which
+    # says nothing about the report itself. Its time budget still applies,
+    # reports of batches that time out are evaluated on their own.
+    if result.timed_out:
+        return True
+    return not result.batched and result.duration * 1000 > get_slow_threshold()
+
+
+def get_suspended(report_ids):
+    """
+    Return a dict of the time until which each of the given reports is
+    suspended, by report id, for those that are suspended.
+    """
+    report_ids = list(report_ids)
+    now = time.time()
+    suspended = result_cache.get_cache().get_many([SUSPENDED_KEY % report_id for report_id in report_ids])
+    return dict(
+        (report_id, suspended[SUSPENDED_KEY % report_id])
+        for report_id in report_ids
+        if suspended.get(SUSPENDED_KEY % report_id, 0) > now
+    )
+
+
+def suspend(report_ids):
+    # Every report has a key of its own, so processes suspending different
+    # reports at once do not overwrite each other
+    until = time.time() + get_cooldown()
+    result_cache.get_cache().set_many(
+        dict((SUSPENDED_KEY % report_id, until) for report_id in report_ids),
+        get_cooldown()
+    )
+
+
+def resume(report_id):
+    """
+    Evaluate a suspended report again, e.g. because its filters changed.
+    """
+    result_cache.get_cache().delete_many([SUSPENDED_KEY % report_id, FAILURES_KEY % report_id])
+
+
+def record(results):
+    """
+    Record the outcome of the given computed results, suspending reports
+    that failed too many times in a row.
+    """
+    threshold = get_failure_threshold()
+    if not threshold:
+        return
+
+    # Unsaved reports, e.g. those of the benchmarks, are never suspended
+    results = [result for result in results if result.report.pk is not None]
+    cache = result_cache.get_cache()
+    failed = [result for result in results if is_failure(result)]
+    succeeded = [FAILURES_KEY % result.report.pk for result in results if result not in failed]
+    if succeeded:
+        cache.delete_many(succeeded)
+
+    tripped = []
+    for result in failed:
+        key = FAILURES_KEY % result.report.pk
+        result_cache.increment(key, 1)
+        if cache.get(key, 0) >= threshold:
+            cache.delete(key)
+            tripped.append(result.report.pk)
+    if tripped:
+        suspend(tripped)
+
+
+def load(results):
+    """
+    Hand the last computed result of their report to each of the given
+    results whose report is suspended, or an empty list if there is none.
+    Returns the results of suspended reports.
+    """
+    suspended = get_suspended(set(result.report.pk for result in results if result.report.pk is not None))
+    results = [result for result in results if result.report.pk in suspended]
+    loaded = result_cache.load_last(results)
+    for result in results:
+        result.suspended = True
+        if result not in loaded:
+            result.list = []
+            result.count = None
+    return results
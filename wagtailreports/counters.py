@@ -0,0 +1,120 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from wagtail.wagtailcore.models import Page, get_page_models
+
+from wagtailreports.models import PageCount
+
+FLAG_FIELDS = ('live', 'expired', 'locked', 'has_unpublished_changes')
+
+
+def is_enabled():
+    """
+    Whether total counts of reports that only filter on flags are read from
+    the page counts, enable with ``WAGTAILREPORTS_COUNTERS = True`` after
+    running the ``rebuild_page_counts`` management command. Page counts are
+    kept up to date from page signals, so pages changed through
+    ``QuerySet.update()`` are missed until the next rebuild.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_COUNTERS', False)
+
+
+def can_count(report):
+    return report.content_type_id is not None and not report.query and not report.has_periods()
+
+
+def get_flags(page):
+    return dict((name, getattr(page, name)) for name in FLAG_FIELDS)
+
+
+def get_counted_content_type_ids(content_type_id):
+    """
+    Return the ids of the content types of the pages a report on the given
+    content type selects, i.e. that of its model and all page models
+    inheriting from it.
+    """
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    if model is None:
+        return [content_type_id]
+    models = set([model] + [page_model for page_model in get_page_models() if issubclass(page_model, model)])
+    return [content_type.pk for content_type in ContentType.objects.get_for_models(*models).values()]
+
+
+def load(results):
+    """
+    Hand the total count from the page counts to each of the given results
+    whose report only filters on flags, with a single query for all of
+    them. Returns the results that got their count.
+    """
+    results = [result for result in results if can_count(result.report)]
+    if not is_enabled() or not results:
+        return []
+
+    content_type_ids = dict(
+        (result, set(get_counted_content_type_ids(result.report.content_type_id))) for result in results
+    )
+    page_counts = list(PageCount.objects.filter(
+        content_type_id__in=set.union(*content_type_ids.values())
+    ).values('content_type_id', 'count', *FLAG_FIELDS))
+
+    for result in results:
+        report = result.report
+        result.count = sum(
+            page_count['count'] for page_count in page_counts
+            if page_count['content_type_id'] in content_type_ids[result] and all(
+                getattr(report, name) is None or getattr(report, name) == page_count[name]
+                for name in FLAG_FIELDS
+            )
+        )
+    return results
+
+
+def adjust(content_type_id, flags, delta):
+    filters = dict(flags, content_type_id=content_type_id)
+    if PageCount.objects.filter(**filters).update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            PageCount.objects.create(count=delta, **filters)
+    except IntegrityError:
+        # Created by a concurrent request
+        PageCount.objects.filter(**filters).update(count=F('count') + delta)
+
+
+def page_saved(page, old_state=None, created=False):
+    """
+    Update the page counts for a saved page. Pass the state of the page
+    before it was saved, see :func:`wagtailreports.snapshots.get_page_state`.
+    """
+    flags = get_flags(page)
+    if created:
+        adjust(page.content_type_id, flags, 1)
+    elif old_state is not None:
+        old_flags = dict((name, old_state[name]) for name in FLAG_FIELDS)
+        if old_flags != flags:
+            adjust(page.content_type_id, old_flags, -1)
+            adjust(page.content_type_id, flags, 1)
+
+
+def page_deleted(page):
+    adjust(page.content_type_id, get_flags(page), -1)
+
+
+def rebuild():
+    """
+    Count all pages by content type and flags from scratch.
+    """
+    rows = Page.objects.order_by().values('content_type_id', *FLAG_FIELDS).annotate(number=Count('pk'))
+    with transaction.atomic():
+        PageCount.objects.all().delete()
+        PageCount.objects.bulk_create([
+            PageCount(
+                content_type_id=row['content_type_id'],
+                count=row['number'],
+                **dict((name, row[name]) for name in FLAG_FIELDS)
+            )
+            for row in rows
+        ])
@@ -0,0 +1,225 @@
+from __future__ import absolute_import, unicode_literals
+
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Aggregate, Case, Count, IntegerField, Value, When
+
+from wagtailreports import circuit_breaker, counters, result_cache, rows, snapshots
+from wagtailreports.results import WINDOW_COUNT_ANNOTATION, share_results, window_count
+from wagtailreports.timeouts import ReportTimeout, time_budget
+from wagtailreports.utils import count_queries
+
+REPORT_ID_ANNOTATION = 'wagtailreports_report_id'
+
+# Alias of the count of each report, which must not be a page field name
+COUNT_ALIAS = 'report_%d'
+
+
+class FilteredCount(Aggregate):
+    """
+    Count the rows matching a condition, as ``COUNT(*) FILTER (WHERE ...)``
+    on PostgreSQL and ``SUM(CASE WHEN ... THEN 1 ELSE 0 END)`` elsewhere.
+
+    Aliases of the aggregates must not be names of fields the conditions
+    refer to, the condition would refer to the aggregate instead, see
+    ``COUNT_ALIAS``.
+    """
+    function = 'SUM'
+    name = 'FilteredCount'
+
+    def __init__(self, condition, **extra):
+        super(FilteredCount, self).__init__(
+            Case(When(condition, then=Value(1)), default=Value(0), output_field=IntegerField()),
+            output_field=IntegerField(),
+            **extra
+        )
+
+    def as_postgresql(self, compiler, connection):
+        condition = self.get_source_expressions()[0].cases[0].condition
+        sql, params = compiler.compile(condition)
+        return 'COUNT(*) FILTER (WHERE %s)' % sql, params
+
+
+def group_by_content_type(results):
+    """
+    Group report results by the content type of their report, and whether
+    they list rows or pages. Reports without a content type are left out.
+    """
+    groups = OrderedDict()
+    for result in results:
+        content_type_id = result.report.content_type_id
+        if content_type_id is not None:
+            groups.setdefault((content_type_id, result.as_rows), []).append(result)
+    return groups
+
+
+def supports_compound_slicing(queryset):
+    """
+    Whether the database of the queryset allows LIMIT in the parts of a UNION.
+    """
+    features = connections[queryset.db].features
+    return hasattr(queryset, 'union') and getattr(features, 'supports_slicing_ordering_in_compound', False)
+
+
+def fetch_lists(results):
+    """
+    Fetch the lists of several results for reports on the same content type
+    in a single UNION ALL statement, with the total counts of the reports
+    that display them when the database supports window functions. Falls
+    back on a query per report when the database does not support slicing
+    the parts of a compound statement.
+    """
+    if len(results) < 2 or not supports_compound_slicing(results[0].queryset):
+        for result in results:
+            result.fetch_list()
+        return
+
+    annotations = [REPORT_ID_ANNOTATION, WINDOW_COUNT_ANNOTATION]
+    querysets = [
+        result.prepare(result.listing_queryset.annotate(**{
+            REPORT_ID_ANNOTATION: Value(result.report.pk, output_field=IntegerField()),
+            WINDOW_COUNT_ANNOTATION: window_count(result.uses_window_count),
+        }), annotations)[:result.report.list_length]
+        for result in results
+    ]
+    lists = {}
+    for row in results[0].build(querysets[0].union(*querysets[1:], all=True), annotations):
+        lists.setdefault(getattr(row, REPORT_ID_ANNOTATION), []).append(row)
+
+    for result in results:
+        result.set_list(lists.get(result.report.pk, []), result.uses_window_count)
+
+
+def fetch_counts(results):
+    """
+    Fetch the exact total counts of several results for reports on the same
+    content type with a single conditional aggregation, so the pages are
+    scanned once instead of once per report. Results that already know their
+    count, e.g. from a window count, are skipped.
+    """
+    results = [result for result in results if result.needs_exact_count]
+    if len(results) < 2:
+        return
+
+    aggregates = {}
+    for result in results:
+        condition = result.report.get_filter(result.now)
+        aggregates[COUNT_ALIAS % result.report.pk] = FilteredCount(condition) if condition else Count('pk')
+    counts = results[0].report.get_base_queryset().aggregate(**aggregates)
+
+    for result in results:
+        result.count = counts[COUNT_ALIAS % result.report.pk] or 0
+
+
+def get_time_budget(results):
+    # Queries for several reports may take as long as the largest budget
+    budgets = [result.report.get_time_budget() for result in results]
+    return 0 if 0 in budgets else max(budgets)
+
+
+def evaluate_group(results):
+    """
+    Fetch the lists and remaining counts of results for reports on the same
+    content type. If that takes longer than their time budget, each result
+    is evaluated on its own so only the slow reports time out.
+    """
+    start = time.time()
+    try:
+        with count_queries(connections[results[0].queryset.db]) as queries:
+            with time_budget(get_time_budget(results), results[0].queryset.db):
+                fetch_lists([result for result in results if not result.is_listed])
+                fetch_counts(results)
+        for result in results:
+            result.duration += (time.time() - start) / len(results)
+            result.query_count += queries['count'] / len(results)
+            result.batched = result.batched or len(results) > 1
+    except ReportTimeout:
+        if len(results) == 1:
+            results[0].time_out()
+        else:
+            for result in results:
+                evaluate_group([result])
+
+
+def get_max_workers():
+    """
+    Number of threads content types are evaluated on concurrently, set
+    ``WAGTAILREPORTS_MAX_WORKERS`` to 2 or more to enable. Every thread uses
+    its own database connection, so queries run outside the transaction of
+    the request.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_MAX_WORKERS', 0)
+
+
+def run_in_thread(function, *args):
+    try:
+        return function(*args)
+    finally:
+        # Database connections are per thread, close those this one opened
+        connections.close_all()
+
+
+def evaluate_groups(groups):
+    """
+    Evaluate groups of results per content type, on a pool of threads if
+    enabled so the evaluation takes about as long as the slowest group.
+    """
+    max_workers = min(get_max_workers(), len(groups))
+    if max_workers < 2:
+        for group in groups:
+            evaluate_group(group)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_in_thread, evaluate_group, group) for group in groups]
+    for future in futures:
+        # Raise the exceptions of the threads
+        future.result()
+
+
+def evaluate_reports(reports, now=None, as_rows=False):
+    """
+    Evaluate the lists and counts of all given reports, using a single
+    query per content type for the lists and one for the remaining counts
+    instead of one or two per report. Content types can be evaluated
+    concurrently, see :func:`get_max_workers`.
+
+    Instances of the same report share their result, see
+    :func:`~wagtailreports.results.share_results`, and results are shared
+    between users through the result cache. Reports with a snapshot are
+    read from it, see :mod:`wagtailreports.snapshots`, and suspended
+    reports are not evaluated, see :mod:`wagtailreports.circuit_breaker`.
+    Periods are relative to ``now``, so pass the same time for all reports
+    on a page. Pass
+    ``as_rows=True`` to list :class:`~wagtailreports.rows.ReportRow` objects
+    instead of pages, annotated for rendering without further queries, see
+    :func:`~wagtailreports.rows.annotate`. Returns a dict of results by
+    report id.
+    """
+    results = share_results(reports, now, as_rows)
+    evaluated = pending = [result for result in results.values() if not result.is_evaluated]
+    hits = result_cache.load(pending)
+    hits += snapshots.load([result for result in pending if result not in hits])
+    hits += circuit_breaker.load([result for result in pending if result not in hits])
+    pending, locks = result_cache.single_flight([result for result in pending if result not in hits])
+
+    try:
+        counters.load(result for result in pending if result.needs_count)
+        evaluate_groups(list(group_by_content_type(pending).values()))
+        for result in pending:
+            result.evaluate(use_cache=False)
+
+        circuit_breaker.record(pending)
+        snapshots.store(pending)
+        result_cache.store(pending)
+    finally:
+        result_cache.release(locks)
+
+    for result in evaluated:
+        result.send_evaluated(cache_hit=result not in pending)
+    rows.annotate(row for result in results.values() if result.as_rows for row in result.list)
+    return results
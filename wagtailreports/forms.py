@@ -1,13 +1,108 @@
 from __future__ import absolute_import, unicode_literals
 
+import copy
+import logging
+
 from django import forms
-from django.forms.models import modelform_factory
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.forms.models import construct_instance, modelform_factory
+from django.utils.translation import ugettext as _
+
 from wagtailreports.permissions import report_permission_policy, report_panel_permission_policy
+from wagtailreports.results import ReportResult, estimate_cost
+
+logger = logging.getLogger('wagtailreports')
+
+# Number of pages previewed while validating a report
+PREVIEW_LENGTH = 10
+
+
+def get_cost_threshold():
+    """
+    Planner cost above which reports need the ``save_expensive_report``
+    permission to be saved, only PostgreSQL estimates costs.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_COST_THRESHOLD', None)
+
+
+def get_row_threshold():
+    """
+    Estimated number of pages a report returns above which it needs the
+    ``save_expensive_report`` permission to be saved.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_ROW_THRESHOLD', None)
 
 
 class BaseReportForm(forms.ModelForm):
     permission_policy = report_permission_policy
 
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop('user', None)
+        super(BaseReportForm, self).__init__(*args, **kwargs)
+        self.preview = None
+        self.preview_failed = False
+
+    def get_preview(self, report):
+        """
+        Return the estimated number of rows and cost of the query of the
+        report, and its first pages.
+        """
+        result = ReportResult(report)
+        rows, cost = estimate_cost(result.queryset, report.get_base_queryset())
+        return {
+            'rows': rows,
+            'cost': cost,
+            'list': list(result.listing_queryset[:min(report.list_length, PREVIEW_LENGTH)]),
+        }
+
+    def get_exceeded_limits(self, preview):
+        """
+        Return a message for each threshold the preview of a report exceeds.
+        """
+        limits = []
+        cost_threshold = get_cost_threshold()
+        if cost_threshold is not None and preview['cost'] is not None and preview['cost'] > cost_threshold:
+            limits.append(_("its estimated query cost of %(cost)d exceeds the limit of %(threshold)d") % {
+                'cost': preview['cost'],
+                'threshold': cost_threshold,
+            })
+        row_threshold = get_row_threshold()
+        if row_threshold is not None and preview['rows'] > row_threshold:
+            limits.append(_("it is estimated to return %(rows)d pages, more than the limit of %(threshold)d") % {
+                'rows': preview['rows'],
+                'threshold': row_threshold,
+            })
+        return limits
+
+    def can_save_expensive_reports(self):
+        return self.user is not None and self.user.has_perm(
+            '%s.save_expensive_report' % self._meta.model._meta.app_label
+        )
+
+    def clean(self):
+        cleaned_data = super(BaseReportForm, self).clean()
+        if self.errors or not cleaned_data.get('content_type'):
+            return cleaned_data
+
+        report = construct_instance(self, copy.copy(self.instance), self._meta.fields, self._meta.exclude)
+        try:
+            with transaction.atomic():
+                self.preview = self.get_preview(report)
+        except DatabaseError:
+            # E.g. a statement that timed out, leave it to the time budget
+            logger.warning("Could not estimate the cost of report %r", report.title, exc_info=True)
+            self.preview_failed = True
+            return cleaned_data
+
+        limits = self.get_exceeded_limits(self.preview)
+        if limits and not self.can_save_expensive_reports():
+            raise forms.ValidationError(_(
+                "This report is too expensive: %(limits)s. "
+                "Narrow down its filters or ask an administrator to save it."
+            ) % {'limits': '; '.join(limits)})
+        return cleaned_data
+
 
 def get_report_form(model):
     fields = model.admin_form_fields
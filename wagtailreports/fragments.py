@@ -0,0 +1,60 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.template.loader import render_to_string
+from django.utils import timezone, translation
+from django.utils.safestring import mark_safe
+
+from wagtailreports import result_cache
+from wagtailreports.evaluation import evaluate_reports
+from wagtailreports.results import share_results
+
+FRAGMENT_KEY = result_cache.CACHE_PREFIX + ':fragment:%d:%s:%s:%s'
+FRAGMENT_TEMPLATE = 'wagtailreports/homepage/_report.html'
+
+
+def get_keys(results):
+    """
+    Return a list of (cache key, result) pairs for the rendered fragments of
+    the given results. Keys extend those of the result cache, so fragments
+    are invalidated along with the results, and differ per report, language
+    and time zone.
+    """
+    return [
+        (FRAGMENT_KEY % (
+            result.report.pk,
+            key,
+            translation.get_language(),
+            timezone.get_current_timezone_name(),
+        ), result)
+        for key, result in result_cache.get_keys(results)
+    ]
+
+
+def render_reports(reports, now=None):
+    """
+    Render the dashboard section of each of the given reports, reading
+    fragments from the result cache where possible and evaluating the
+    others in one go. Returns a dict of HTML by report id.
+    """
+    results = share_results(reports, now, as_rows=True)
+    fragments = {}
+    keys = []
+    cacheable = [result for result in results.values() if result.report.content_type_id is not None]
+    if result_cache.get_timeout() and cacheable:
+        keys = get_keys(cacheable)
+        entries = result_cache.get_cache().get_many([key for key, result in keys])
+        for key, result in keys:
+            if key in entries:
+                fragments[result.report.pk] = mark_safe(entries[key])
+
+    missing = [result for result in results.values() if result.report.pk not in fragments]
+    evaluate_reports([result.report for result in missing], now, as_rows=True)
+    for result in missing:
+        fragments[result.report.pk] = render_to_string(FRAGMENT_TEMPLATE, {'report': result.report})
+
+    # Fragments of outdated or missing results would outlive them
+    result_cache.get_cache().set_many(dict(
+        (key, fragments[result.report.pk]) for key, result in keys
+        if result in missing and not (result.is_stale or result.timed_out or result.suspended)
+    ), result_cache.get_timeout())
+    return fragments
@@ -0,0 +1,58 @@
+from __future__ import absolute_import, unicode_literals
+
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from wagtailreports import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time report evaluation, the dashboard panel, the reports index and the chooser on a generated "
+        "page tree, and write the timings as JSON. Changes are rolled back unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=10000, help="Number of pages to generate, e.g. 10000, "
+                            "100000 or 1000000.")
+        parser.add_argument('--repeat', type=int, default=3, help="Number of times to time each operation.")
+        parser.add_argument('--content-type', action='append', dest='content_types', help="Page model to run "
+                            "reports on as app_label.model, may be repeated. All page models by default.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random page flags.")
+        parser.add_argument('--output', help="File to write the JSON timings to, standard output by default.")
+        parser.add_argument('--keep', action='store_true', help="Keep the generated pages and reports.")
+        parser.add_argument('--with-cache', action='store_true', help="Leave the result cache enabled.")
+
+    def handle(self, **options):
+        # Keep statistics and the circuit breaker from affecting the timings
+        settings = {'WAGTAILREPORTS_STATISTICS': False, 'WAGTAILREPORTS_SUSPEND_AFTER': 0}
+        if not options['with_cache']:
+            settings['WAGTAILREPORTS_CACHE_TIMEOUT'] = 0
+        with transaction.atomic(), override_settings(**settings):
+            benchmarks.generate_pages(options['pages'], seed=options['seed'])
+            timings = benchmarks.run(repeat=options['repeat'], content_types=options['content_types'])
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        output = json.dumps({
+            'date': timezone.now().isoformat(),
+            'pages': options['pages'],
+            'repeat': options['repeat'],
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'timings': timings,
+        }, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+            if options['verbosity'] >= 1:
+                self.stdout.write("Wrote %d timings to %s." % (len(timings), options['output']))
+        else:
+            self.stdout.write(output)
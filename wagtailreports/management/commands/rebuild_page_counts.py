@@ -0,0 +1,15 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from wagtailreports import counters
+from wagtailreports.models import PageCount
+
+
+class Command(BaseCommand):
+    help = "Rebuild the page counts reports that only filter on flags read their total count from."
+
+    def handle(self, **options):
+        counters.rebuild()
+        if options['verbosity'] >= 1:
+            self.stdout.write("Rebuilt %d page counts." % PageCount.objects.count())
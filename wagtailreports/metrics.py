@@ -0,0 +1,152 @@
+from __future__ import absolute_import, unicode_literals
+
+import threading
+from collections import OrderedDict
+
+# Upper bounds in seconds of the buckets of latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric(object):
+    """
+    A metric kept in the memory of this process, with a value per
+    combination of label values. Each worker process reports its own.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_labels(self, label_values):
+        return tuple(zip(self.labels, label_values))
+
+    def render_samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            '# HELP %s %s' % (self.name, self.documentation),
+            '# TYPE %s %s' % (self.name, self.type),
+        ]
+        with self.lock:
+            lines.extend(self.render_samples())
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        return self.values.get(label_values, 0)
+
+    def render_samples(self):
+        return [
+            '%s%s %s' % (self.name, format_labels(self.get_labels(label_values)), format_value(value))
+            for label_values, value in self.values.items()
+        ]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            counts, total = self.values.get(label_values, ([0] * len(self.buckets), 0.0))
+            counts = [count + (value <= bound) for count, bound in zip(counts, self.buckets)]
+            self.values[label_values] = (counts, total + value)
+
+    def render_samples(self):
+        lines = []
+        for label_values, (counts, total) in self.values.items():
+            labels = self.get_labels(label_values)
+            for count, bound in zip(counts, self.buckets):
+                lines.append('%s_bucket%s %s' % (
+                    self.name, format_labels(labels + (('le', format_value(bound)),)), format_value(count)
+                ))
+            lines.append('%s_sum%s %s' % (self.name, format_labels(labels), format_value(total)))
+            lines.append('%s_count%s %s' % (self.name, format_labels(labels), format_value(counts[-1])))
+        return lines
+
+
+evaluation_seconds = Histogram(
+    'wagtailreports_evaluation_seconds',
+    "Time spent in queries evaluating a report.",
+    labels=('report',),
+)
+panel_render_seconds = Histogram(
+    'wagtailreports_panel_render_seconds',
+    "Time taken to render the report panels of the dashboard.",
+)
+cache_requests = Counter(
+    'wagtailreports_cache_requests_total',
+    "Report evaluations served from a cache (hit) or computed (miss).",
+    labels=('result',),
+)
+rows_served = Counter(
+    'wagtailreports_rows_total',
+    "Rows listed by evaluated reports.",
+)
+timeouts = Counter(
+    'wagtailreports_timeouts_total',
+    "Report evaluations that exceeded their time budget.",
+    labels=('report',),
+)
+
+registry = [evaluation_seconds, panel_render_seconds, cache_requests, rows_served, timeouts]
+
+
+def report_evaluated(sender, result, duration, queries, rows, cache_hit, **kwargs):
+    cache_requests.inc(1, 'hit' if cache_hit else 'miss')
+    rows_served.inc(rows)
+    if not cache_hit:
+        evaluation_seconds.observe(duration, result.report.pk)
+    if result.timed_out:
+        timeouts.inc(1, result.report.pk)
+
+
+def get_cache_hit_ratio():
+    hits = cache_requests.get('hit')
+    total = hits + cache_requests.get('miss')
+    return float(hits) / total if total else 0.0
+
+
+def render():
+    """
+    Return all metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    lines.extend([
+        '# HELP wagtailreports_cache_hit_ratio Share of report evaluations served from a cache.',
+        '# TYPE wagtailreports_cache_hit_ratio gauge',
+        'wagtailreports_cache_hit_ratio %s' % format_value(get_cache_hit_ratio()),
+    ])
+    return '\n'.join(lines) + '\n'
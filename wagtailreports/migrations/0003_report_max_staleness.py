@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailreports', '0002_initial_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='max_staleness',
+            field=models.PositiveIntegerField(default=0, help_text='Number of seconds outdated results may be displayed while they are refreshed in the background. Use 0 to always wait for up-to-date results.', verbose_name='maximum staleness'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('wagtailreports', '0004_reportsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('live', models.BooleanField()),
+                ('expired', models.BooleanField()),
+                ('locked', models.BooleanField()),
+                ('has_unpublished_changes', models.BooleanField()),
+                ('count', models.IntegerField(default=0)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='pagecount',
+            unique_together=set([('content_type', 'live', 'expired', 'locked', 'has_unpublished_changes')]),
+        ),
+    ]
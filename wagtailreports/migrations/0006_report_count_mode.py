@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailreports', '0005_pagecount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='count_mode',
+            field=models.CharField(blank=True, choices=[('', 'Exact'), ('estimated', 'Estimated'), ('capped', 'Capped')], help_text='Estimated and capped counts are much faster for reports on many pages. Capped counts stop counting at a maximum, e.g. "1000+".', max_length=20, verbose_name='count mode'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailreports', '0006_report_count_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='time_budget',
+            field=models.PositiveIntegerField(default=0, help_text='Number of milliseconds the queries of this report may take before the dashboard gives up on it. Use 0 for the site default.', verbose_name='time budget'),
+        ),
+    ]
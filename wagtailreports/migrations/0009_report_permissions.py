@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailreports', '0008_reportstatistics'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='report',
+            options={'permissions': (('save_expensive_report', 'Can save reports above the cost threshold'),), 'verbose_name': 'report'},
+        ),
+    ]
@@ -1,48 +1,131 @@
 from __future__ import absolute_import, unicode_literals
 
-from datetime import timedelta
+import calendar
+import math
+from datetime import datetime, time, timedelta
 
 from django.conf import settings
-from django.core.exceptions import ImproperlyConfigured
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import connection, models
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
 from django.dispatch import Signal
 from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
+from wagtail.wagtailcore.models import Page, PageRevision
 from wagtail.wagtailsearch import index
 from wagtail.wagtailsearch.queryset import SearchableQuerySetMixin
 
+try:
+    from django.db.models import OuterRef, Subquery
+except ImportError:  # Django < 1.11
+    OuterRef = Subquery = None
 
-def string_to_datetime(val):
-    now = timezone.now()
-    day_start = now.replace(hour=0, minute=0, second=0)
-    day_end = day_start + timedelta(days=1)
-    return {
-        'now-14d': (now, day_end + timedelta(days=14)),
-        'now-7d': (now, day_end + timedelta(days=7)),
-        'now-3d': (now, day_end + timedelta(days=3)),
-        'now-2d': (now, day_end + timedelta(days=2)),
-        'now-1d': (now, day_end + timedelta(days=1)),
-        'now-3h': (now, now + timedelta(hours=3)),
-        'now-2h': (now, now + timedelta(hours=2)),
-        'now-1h': (now, now + timedelta(hours=1)),
-        'today': (day_start, day_end),
-        '1h-now': (now - timedelta(hours=1), now),
-        '2h-now': (now - timedelta(hours=2), now),
-        '3h-now': (now - timedelta(hours=3), now),
-        'mn-now': (day_start, now),
-        '2d-now': (day_start - timedelta(days=2), now),
-        '3d-now': (day_start - timedelta(days=3), now),
-        '7d-now': (day_start - timedelta(days=7), now),
-        '14d-now': (day_start - timedelta(days=14), now),
-    }[val]
+
+def get_time_granularity():
+    """
+    Number of seconds the boundaries of periods are rounded down to, so
+    evaluations within the same interval use the same query parameters.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_TIME_GRANULARITY', 60)
+
+
+def quantize(value, granularity=None):
+    """
+    Round a datetime down to a multiple of ``granularity`` seconds.
+    """
+    if granularity is None:
+        granularity = get_time_granularity()
+    value = value.replace(microsecond=0)
+    if granularity:
+        value -= timedelta(seconds=calendar.timegm(value.utctimetuple()) % granularity)
+    return value
+
+
+def get_midnight(now):
+    """
+    Return the start of the day of ``now`` in the active time zone.
+    """
+    if timezone.is_aware(now):
+        return timezone.make_aware(
+            datetime.combine(timezone.localtime(now).date(), time()),
+            timezone.get_current_timezone()
+        )
+    return datetime.combine(now.date(), time())
+
+
+# Periods by name, as functions of the current time and the start of today
+# returning the start and the end of the period.
+PERIODS = {
+    'now-14d': lambda now, day_start: (now, day_start + timedelta(days=15)),
+    'now-7d': lambda now, day_start: (now, day_start + timedelta(days=8)),
+    'now-3d': lambda now, day_start: (now, day_start + timedelta(days=4)),
+    'now-2d': lambda now, day_start: (now, day_start + timedelta(days=3)),
+    'now-1d': lambda now, day_start: (now, day_start + timedelta(days=2)),
+    'now-mn': lambda now, day_start: (now, day_start + timedelta(days=1)),
+    'now-3h': lambda now, day_start: (now, now + timedelta(hours=3)),
+    'now-2h': lambda now, day_start: (now, now + timedelta(hours=2)),
+    'now-1h': lambda now, day_start: (now, now + timedelta(hours=1)),
+    'today': lambda now, day_start: (day_start, day_start + timedelta(days=1)),
+    '1h-now': lambda now, day_start: (now - timedelta(hours=1), now),
+    '2h-now': lambda now, day_start: (now - timedelta(hours=2), now),
+    '3h-now': lambda now, day_start: (now - timedelta(hours=3), now),
+    'mn-now': lambda now, day_start: (day_start, now),
+    '2d-now': lambda now, day_start: (day_start - timedelta(days=2), now),
+    '3d-now': lambda now, day_start: (day_start - timedelta(days=3), now),
+    '7d-now': lambda now, day_start: (day_start - timedelta(days=7), now),
+    '14d-now': lambda now, day_start: (day_start - timedelta(days=14), now),
+}
+
+
+def string_to_datetime(val, now=None):
+    """
+    Return the start and the end of the period named ``val``, relative to
+    ``now`` (defaults to the current time) rounded down to the time
+    granularity.
+    """
+    if now is None:
+        now = timezone.now()
+    now = quantize(now)
+    return PERIODS[val](now, get_midnight(now))
 
 
 class ReportQuerySet(SearchableQuerySetMixin, models.QuerySet):
     pass
 
 
+def latest_revision_user_id():
+    """
+    Expression selecting the id of the user who created the latest revision
+    of each page, written out as SQL on Django versions without
+    ``Subquery``.
+    """
+    if Subquery is not None:
+        latest_revisions = PageRevision.objects.filter(page_id=OuterRef('pk')).order_by('-created_at', '-id')
+        return Subquery(latest_revisions.values('user_id')[:1])
+
+    qn = connection.ops.quote_name
+    columns = dict(
+        (name, qn(PageRevision._meta.get_field(name).column)) for name in ('user', 'page', 'created_at', 'id')
+    )
+    return RawSQL(
+        'SELECT %s FROM %s WHERE %s = %s.%s ORDER BY %s DESC, %s DESC LIMIT 1' % (
+            columns['user'],
+            qn(PageRevision._meta.db_table),
+            columns['page'],
+            qn(Page._meta.db_table),
+            qn(Page._meta.pk.column),
+            columns['created_at'],
+            columns['id'],
+        ),
+        (),
+        output_field=models.IntegerField(),
+    )
+
+
 @python_2_unicode_compatible
 class AbstractReport(index.Indexed, models.Model):
     title = models.CharField(
@@ -132,6 +215,40 @@ class AbstractReport(index.Indexed, models.Model):
         verbose_name=_('display total count'),
         default=False
     )
+    EXACT = ''
+    ESTIMATED = 'estimated'
+    CAPPED = 'capped'
+    COUNT_MODE_CHOICES = [
+        (EXACT, _('Exact')),
+        (ESTIMATED, _('Estimated')),
+        (CAPPED, _('Capped')),
+    ]
+    count_mode = models.CharField(
+        verbose_name=_('count mode'),
+        choices=COUNT_MODE_CHOICES,
+        max_length=20,
+        blank=True,
+        help_text=_(
+            'Estimated and capped counts are much faster for reports on many pages. '
+            'Capped counts stop counting at a maximum, e.g. "1000+".'
+        ),
+    )
+    max_staleness = models.PositiveIntegerField(
+        verbose_name=_('maximum staleness'),
+        default=0,
+        help_text=_(
+            'Number of seconds outdated results may be displayed while they are refreshed in the background. '
+            'Use 0 to always wait for up-to-date results.'
+        ),
+    )
+    time_budget = models.PositiveIntegerField(
+        verbose_name=_('time budget'),
+        default=0,
+        help_text=_(
+            'Number of milliseconds the queries of this report may take before the dashboard gives up on it. '
+            'Use 0 for the site default.'
+        ),
+    )
     # Meta fields
     created_at = models.DateTimeField(
         verbose_name=_('created at'),
@@ -148,6 +265,26 @@ class AbstractReport(index.Indexed, models.Model):
 
     objects = ReportQuerySet.as_manager()
 
+    # Memoized ReportResult, see results()
+    _report_result = None
+
+    # Fields that define the results of a report, reports with the same
+    # values share their entries in the result cache.
+    definition_fields = (
+        'content_type_id',
+        'query',
+        'owner',
+        'live',
+        'go_live_at',
+        'expire_at',
+        'expired',
+        'locked',
+        'has_unpublished_changes',
+        'list_length',
+        'total_count',
+        'count_mode',
+    )
+
     def __str__(self):
         return self.title
 
@@ -159,40 +296,137 @@ class AbstractReport(index.Indexed, models.Model):
         from wagtailreports.permissions import report_permission_policy
         return report_permission_policy.user_has_permission_for_instance(user, 'change', self)
 
-    def results(self):
-        qs = self.content_type.get_all_objects_for_this_type()
+    # Page fields the dashboard displays, results load only these
+    listing_fields = (
+        'id',
+        'title',
+        'draft_title',
+        'live',
+        'expired',
+        'has_unpublished_changes',
+        'locked',
+        'path',
+        'depth',
+        'url_path',
+        'go_live_at',
+        'expire_at',
+        'latest_revision_created_at',
+    )
+    # Annotations of the listing queryset, see get_listing_queryset()
+    listing_annotations = (
+        'latest_revision_user_id',
+    )
+
+    def get_listing_fields(self, model):
+        """
+        Return the listing fields the given page model has, fields that are
+        missing in older versions of Wagtail are left out.
+        """
+        fields = []
+        for name in self.listing_fields:
+            try:
+                model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            fields.append(name)
+        return fields
+
+    def get_base_queryset(self):
+        """
+        Return the queryset of all pages of the content type of this report.
+        The content type is looked up in the content type cache rather than
+        through the foreign key, which would take a query per report.
+        """
+        return ContentType.objects.get_for_id(self.content_type_id).get_all_objects_for_this_type()
+
+    def get_filter(self, now=None):
+        """
+        Return a Q object with the filters of this report, with periods
+        relative to ``now``.
+        """
+        q = Q()
         if self.query:
-            qs = qs.filter(title__icontains=self.query)
+            q &= Q(title__icontains=self.query)
         # if self.owner == self.ME:
-        #     qs = qs.filter(owner=self.request.user)
+        #     q &= Q(owner=self.request.user)
         # if self.owner == self.NOT_ME:
-        #     qs = qs.exclude(owner=self.request.user)
+        #     q &= ~Q(owner=self.request.user)
         if self.live is not None:
-            qs = qs.filter(live=self.live)
+            q &= Q(live=self.live)
         if self.go_live_at:
-            start, end = string_to_datetime(self.go_live_at)
-            qs = qs.filter(go_live_at__gte=start, go_live_at__lte=end)
+            start, end = string_to_datetime(self.go_live_at, now)
+            q &= Q(go_live_at__gte=start, go_live_at__lte=end)
         if self.expire_at:
-            start, end = string_to_datetime(self.expire_at)
-            qs = qs.filter(expire_at__gte=start, expire_at__lte=end)
+            start, end = string_to_datetime(self.expire_at, now)
+            q &= Q(expire_at__gte=start, expire_at__lte=end)
         if self.expired is not None:
-            qs = qs.filter(expired=self.expired)
+            q &= Q(expired=self.expired)
         if self.locked is not None:
-            qs = qs.filter(locked=self.locked)
+            q &= Q(locked=self.locked)
         if self.has_unpublished_changes is not None:
-            qs = qs.filter(has_unpublished_changes=self.has_unpublished_changes)
-        ctx = {
-            'list': qs[:self.list_length]
-        }
-        if self.total_count:
-            ctx.update({
-                'count': qs.count()
-            })
-        return ctx
+            q &= Q(has_unpublished_changes=self.has_unpublished_changes)
+        return q
+
+    def get_time_budget(self):
+        """
+        Return the number of milliseconds the queries of this report may
+        take, 0 for no limit. Defaults to ``WAGTAILREPORTS_TIME_BUDGET``.
+        On PostgreSQL the budget applies to each query separately, see
+        :func:`wagtailreports.timeouts.time_budget`.
+        """
+        return self.time_budget or getattr(settings, 'WAGTAILREPORTS_TIME_BUDGET', 0)
+
+    def has_periods(self):
+        return bool(self.go_live_at or self.expire_at)
+
+    def matches(self, values):
+        """
+        Whether a page with the given field values (see ``page_state_fields``)
+        passes the filters of this report. Periods are not taken into account.
+        """
+        if self.query and self.query.lower() not in values['title'].lower():
+            return False
+        for name in ('live', 'expired', 'locked', 'has_unpublished_changes'):
+            if getattr(self, name) is not None and getattr(self, name) != values[name]:
+                return False
+        return True
+
+    def get_queryset(self, now=None):
+        """
+        Return the queryset of pages matching the filters of this report.
+        """
+        return self.get_base_queryset().filter(self.get_filter(now))
+
+    def get_listing_queryset(self, queryset):
+        """
+        Restrict a queryset of pages to the listing fields, so displaying
+        a specific page type does not load its body fields. Pages are
+        annotated with the id of the user who created their latest revision.
+        """
+        return queryset.only(*self.get_listing_fields(queryset.model)).annotate(
+            latest_revision_user_id=latest_revision_user_id(),
+        )
+
+    def results(self, now=None):
+        """
+        Return the :class:`~wagtailreports.results.ReportResult` of this
+        report, with periods relative to ``now`` (defaults to the current time).
+
+        The result is evaluated lazily and memoized on the instance, so
+        templates can access ``results.list`` and ``results.count`` as often
+        as they like without repeating the queries.
+        """
+        from wagtailreports.results import ReportResult
+        if self._report_result is None:
+            self._report_result = ReportResult(self, now)
+        return self._report_result
 
     class Meta:
         abstract = True
         verbose_name = _('report')
+        permissions = (
+            ('save_expensive_report', _('Can save reports above the cost threshold')),
+        )
 
 
 class Report(AbstractReport):
@@ -200,6 +434,9 @@ class Report(AbstractReport):
         'title',
         'list_length',
         'total_count',
+        'count_mode',
+        'max_staleness',
+        'time_budget',
         'query',
         'content_type',
         'owner',
@@ -238,6 +475,98 @@ def get_report_model():
 
 
 report_served = Signal(providing_args=['request'])
+report_evaluated = Signal(providing_args=['result', 'duration', 'queries', 'rows', 'cache_hit'])
+
+
+# Page fields AbstractReport.matches() needs
+page_state_fields = ('title', 'live', 'expired', 'locked', 'has_unpublished_changes')
+
+
+class PageCount(models.Model):
+    """
+    The number of pages of a content type with a combination of flags,
+    kept up to date from page signals, see :mod:`wagtailreports.counters`.
+    """
+    content_type = models.ForeignKey(
+        'contenttypes.ContentType',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    live = models.BooleanField()
+    expired = models.BooleanField()
+    locked = models.BooleanField()
+    has_unpublished_changes = models.BooleanField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('content_type', 'live', 'expired', 'locked', 'has_unpublished_changes')
+
+
+class ReportSnapshot(models.Model):
+    """
+    The latest list and count of a report without periods, kept up to date
+    from page signals, see :mod:`wagtailreports.snapshots`.
+    """
+    report = models.OneToOneField(
+        Report,
+        primary_key=True,
+        related_name='snapshot',
+        on_delete=models.CASCADE,
+    )
+    page_ids = models.TextField(blank=True)
+    count = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_page_ids(self):
+        return [int(page_id) for page_id in self.page_ids.split(',') if page_id]
+
+    def set_page_ids(self, page_ids):
+        self.page_ids = ','.join(str(page_id) for page_id in page_ids)
+
+
+class ReportStatistics(models.Model):
+    """
+    Rolling evaluation statistics of a report, written in batches, see
+    :mod:`wagtailreports.statistics`.
+    """
+    report = models.OneToOneField(
+        Report,
+        primary_key=True,
+        related_name='statistics',
+        on_delete=models.CASCADE,
+    )
+    evaluations = models.PositiveIntegerField(default=0)
+    cache_hits = models.PositiveIntegerField(default=0)
+    queries = models.PositiveIntegerField(default=0)
+    rows = models.PositiveIntegerField(default=0)
+    # Milliseconds taken by the most recent evaluations that were not cache hits
+    durations = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_durations(self):
+        return [int(duration) for duration in self.durations.split(',') if duration]
+
+    def set_durations(self, durations):
+        self.durations = ','.join(str(int(duration)) for duration in durations)
+
+    def get_percentile(self, percentile):
+        """
+        Return the duration in milliseconds the given percentage of recent
+        evaluations took at most, or None if there are none.
+        """
+        durations = sorted(self.get_durations())
+        if not durations:
+            return None
+        rank = int(math.ceil(percentile / 100.0 * len(durations)))
+        return durations[max(rank, 1) - 1]
+
+    @property
+    def p50(self):
+        return self.get_percentile(50)
+
+    @property
+    def p95(self):
+        return self.get_percentile(95)
 
 
 class ReportPanelQuerySet(SearchableQuerySetMixin, models.QuerySet):
@@ -0,0 +1,110 @@
+from __future__ import absolute_import, unicode_literals
+
+import cProfile
+import io
+import marshal
+import pstats
+import time
+
+from django.db import DatabaseError, connections, transaction
+from django.template.loader import render_to_string
+
+from wagtailreports import rows
+from wagtailreports.fragments import FRAGMENT_TEMPLATE
+from wagtailreports.results import ReportResult
+from wagtailreports.utils import capture_queries
+
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+def explain(connection, sql):
+    """
+    Return the query plan of a captured statement as text, or None if the
+    database does not support it or the statement cannot be explained.
+    """
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None:
+        return None
+    try:
+        # A failing statement must not break the transaction of the request
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql)
+                rows = cursor.fetchall()
+    except DatabaseError:
+        return None
+    return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+
+class ReportProfile(object):
+    """
+    The profile of a single evaluation and rendering of a report, bypassing
+    all caches.
+    """
+    def __init__(self, report):
+        self.report = report
+        self.profiler = cProfile.Profile()
+        self.queries = []
+
+    def run(self):
+        connection = connections[self.report.get_base_queryset().db]
+        result = ReportResult(self.report, as_rows=True)
+        self.report._report_result = result
+
+        self.profiler.enable()
+        try:
+            start = time.time()
+            with capture_queries(connection) as evaluation_queries:
+                result.compute()
+                rows.annotate(result.list)
+            self.evaluation_time = time.time() - start
+            start = time.time()
+            with capture_queries(connection) as rendering_queries:
+                render_to_string(FRAGMENT_TEMPLATE, {'report': self.report})
+            self.rendering_time = time.time() - start
+        finally:
+            self.profiler.disable()
+            self.report._report_result = None
+
+        self.result = result
+        self.evaluation_query_time = sum(float(query['time']) for query in evaluation_queries)
+        self.queries = [
+            {
+                'sql': query['sql'],
+                'time': float(query['time']),
+                'plan': explain(connection, query['sql']),
+            }
+            for query in evaluation_queries + rendering_queries
+        ]
+        return self
+
+    @property
+    def query_time(self):
+        return sum(query['time'] for query in self.queries)
+
+    @property
+    def hydration_time(self):
+        """
+        Time spent evaluating outside of the database, mostly building rows.
+        """
+        return max(self.evaluation_time - self.evaluation_query_time, 0)
+
+    def get_stats(self, limit=40):
+        """
+        Return the functions that took most time as text.
+        """
+        output = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def dump(self):
+        """
+        Return the raw profile in the format of ``pstats`` dump files.
+        """
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
@@ -0,0 +1,356 @@
+from __future__ import absolute_import, unicode_literals
+
+import calendar
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from wagtailreports.models import quantize
+from wagtailreports.utils import get_content_type_ids, get_page_content_type_ids
+
+CACHE_PREFIX = 'wagtailreports'
+GENERATION_KEY = CACHE_PREFIX + ':generation:%d'
+RESULT_KEY = CACHE_PREFIX + ':result:%s:%s:%d'
+STALE_KEY = CACHE_PREFIX + ':stale:%s'
+LOCK_KEY = CACHE_PREFIX + ':lock:%s'
+HITS_KEY = CACHE_PREFIX + ':stats:hits'
+MISSES_KEY = CACHE_PREFIX + ':stats:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'WAGTAILREPORTS_CACHE', 'default')]
+
+
+def get_timeout():
+    """
+    Number of seconds results are cached, set
+    ``WAGTAILREPORTS_CACHE_TIMEOUT = 0`` to disable the result cache.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_CACHE_TIMEOUT', 60)
+
+
+def get_lock_timeout():
+    """
+    Number of seconds a process may take to evaluate a report before others
+    stop waiting for it and evaluate the report themselves.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_LOCK_TIMEOUT', 30)
+
+
+def get_last_result_timeout():
+    """
+    Number of seconds the last result of a report is kept, to display when
+    evaluating the report takes too long.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_LAST_RESULT_TIMEOUT', 24 * 60 * 60)
+
+
+def get_definition_hash(report):
+    """
+    Return a hash of the fields that define the results of a report. Reports
+    with the same definition share their cache entries.
+    """
+    definition = [[name, getattr(report, name)] for name in report.definition_fields]
+    return hashlib.md5(json.dumps(definition).encode('utf-8')).hexdigest()
+
+
+def get_result_hash(result):
+    """
+    Return the hash of the definition of the report of a result, telling
+    results that list rows apart from those that list pages.
+    """
+    return get_definition_hash(result.report) + (':rows' if result.as_rows else '')
+
+
+def get_time_bucket(now):
+    """
+    Return the number of the interval of the cache timeout ``now`` falls in.
+    """
+    return calendar.timegm(quantize(now).utctimetuple()) // get_timeout()
+
+
+def get_generations(content_type_ids):
+    """
+    Return the current generation of each content type. A new generation
+    starts whenever a page of that content type changes, which invalidates
+    all cached results for it.
+    """
+    cache = get_cache()
+    keys = dict((GENERATION_KEY % content_type_id, content_type_id) for content_type_id in content_type_ids)
+    generations = cache.get_many(list(keys))
+    missing = dict((key, uuid.uuid4().hex) for key in keys if key not in generations)
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return dict((keys[key], generation) for key, generation in generations.items())
+
+
+def get_keys(results):
+    """
+    Return a list of (cache key, result) pairs for the given report results.
+    """
+    generations = get_generations(set(result.report.content_type_id for result in results))
+    return [
+        (RESULT_KEY % (
+            generations[result.report.content_type_id],
+            get_result_hash(result),
+            get_time_bucket(result.now),
+        ), result)
+        for result in results
+    ]
+
+
+def increment(key, delta):
+    if delta:
+        cache = get_cache()
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.add(key, 0, None)
+            cache.incr(key, delta)
+
+
+def prime(result, rows, total):
+    result.list = rows
+    if result.report.total_count:
+        result.count = total
+    result.from_cache = True
+
+
+def load(results, stats=True):
+    """
+    Hand the cached list and count to each of the given results that has a
+    cache entry. Returns the results that were found in the cache.
+
+    Results of reports with a maximum staleness that are not in the cache
+    get their last computed result if it is recent enough, and a refresh of
+    that report is started in the background.
+    """
+    results = [result for result in results if result.report.content_type_id is not None]
+    if not get_timeout() or not results:
+        return []
+
+    keys = get_keys(results)
+    entries = get_cache().get_many(list(set(key for key, result in keys)))
+    hits = []
+    for key, result in keys:
+        if key in entries:
+            prime(result, *entries[key])
+            hits.append(result)
+
+    stale_keys = [
+        (STALE_KEY % get_result_hash(result), result)
+        for result in results if result not in hits and result.report.max_staleness
+    ]
+    if stale_keys:
+        entries = get_cache().get_many(list(set(key for key, result in stale_keys)))
+        for key, result in stale_keys:
+            if key in entries:
+                computed_at, rows, total = entries[key]
+                if time.time() - computed_at <= result.report.max_staleness:
+                    prime(result, rows, total)
+                    result.is_stale = True
+                    hits.append(result)
+                    refresh(result.report, result.as_rows)
+
+    if stats:
+        increment(HITS_KEY, len(hits))
+        increment(MISSES_KEY, len(results) - len(hits))
+    return hits
+
+
+def store(results):
+    """
+    Store the list and count of the given evaluated results in the cache,
+    and as the last computed result of their reports.
+    """
+    results = [
+        result for result in results
+        if result.report.content_type_id is not None and result.is_evaluated
+        and not result.from_cache and not result.timed_out
+    ]
+    if not get_timeout() or not results:
+        return
+
+    get_cache().set_many(
+        dict((key, (result.list, result.count)) for key, result in get_keys(results)),
+        get_timeout()
+    )
+    for result in results:
+        get_cache().set(
+            STALE_KEY % get_result_hash(result),
+            (time.time(), result.list, result.count),
+            max(result.report.max_staleness, get_last_result_timeout())
+        )
+
+
+def load_last(results):
+    """
+    Hand the last computed result of their report to each of the given
+    results, however old. Returns the results that had one.
+    """
+    results = [result for result in results if result.report.content_type_id is not None]
+    if not get_timeout() or not results:
+        return []
+
+    keys = [(STALE_KEY % get_result_hash(result), result) for result in results]
+    entries = get_cache().get_many(list(set(key for key, result in keys)))
+    hits = []
+    for key, result in keys:
+        if key in entries:
+            computed_at, rows, total = entries[key]
+            prime(result, rows, total)
+            result.is_stale = True
+            hits.append(result)
+    return hits
+
+
+# Lock keys held by the current thread
+held_locks = threading.local()
+
+
+def get_held_locks():
+    if not hasattr(held_locks, 'keys'):
+        held_locks.keys = set()
+    return held_locks.keys
+
+
+def get_lock_key(result):
+    return LOCK_KEY % get_result_hash(result)
+
+
+def acquire(key):
+    """
+    Acquire the lock with the given key, returns False if another process
+    holds it.
+    """
+    if get_cache().add(key, True, get_lock_timeout()):
+        get_held_locks().add(key)
+        return True
+    return False
+
+
+def release(keys):
+    """
+    Release the given locks acquired by :func:`acquire`.
+    """
+    keys = list(keys)
+    get_held_locks().difference_update(keys)
+    get_cache().delete_many(keys)
+
+
+def single_flight(results):
+    """
+    Make sure only one process at a time evaluates the same report, so a
+    cold cache does not make every editor run the same queries at once.
+
+    Acquires the lock for each definition among the given results, results
+    with the same definition share a lock and locks this thread holds
+    already count as acquired. For locks held by another process, waits
+    until that process has stored its result in the cache, or until the
+    lock times out. Returns the results that still need to be evaluated
+    and the keys of the locks acquired; pass those to :func:`release` once
+    the results are stored.
+    """
+    if not get_timeout():
+        return list(results), []
+
+    results_by_key = OrderedDict()
+    for result in results:
+        results_by_key.setdefault(get_lock_key(result), []).append(result)
+    held = get_held_locks()
+    acquired = [key for key in results_by_key if key not in held and acquire(key)]
+    waiting = [result for key in results_by_key if key not in held for result in results_by_key[key]]
+    deadline = time.time() + get_lock_timeout()
+    while waiting and time.time() < deadline:
+        time.sleep(0.1)
+        hits = load(waiting, stats=False)
+        waiting = [result for result in waiting if result not in hits]
+    owned = [result for key in results_by_key if key in held for result in results_by_key[key]]
+    return owned + waiting, acquired
+
+
+def refresh(report, as_rows=False):
+    """
+    Evaluate a report and store its results in the cache in a background
+    thread, unless another process is evaluating it already. Set
+    ``WAGTAILREPORTS_BACKGROUND_REFRESH = False`` to refresh in the current
+    thread instead.
+    """
+    from wagtailreports.results import ReportResult
+
+    result = ReportResult(report, as_rows=as_rows)
+    key = get_lock_key(result)
+    if not acquire(key):
+        return
+
+    background = getattr(settings, 'WAGTAILREPORTS_BACKGROUND_REFRESH', True)
+    if background:
+        # The background thread owns the lock from here on, this thread
+        # must not count it as held
+        get_held_locks().discard(key)
+
+    def run():
+        from wagtailreports import circuit_breaker
+
+        try:
+            result.evaluate(use_cache=False)
+            circuit_breaker.record([result])
+            store([result])
+        finally:
+            if background:
+                get_cache().delete(key)
+                connection.close()
+            else:
+                release([key])
+
+    if background:
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+    else:
+        run()
+
+
+def invalidate(content_type_ids):
+    """
+    Invalidate all cached results for the given content types.
+    """
+    get_cache().set_many(
+        dict((GENERATION_KEY % content_type_id, uuid.uuid4().hex) for content_type_id in content_type_ids),
+        None
+    )
+
+
+def invalidate_model(model):
+    """
+    Invalidate all cached results that may contain instances of the given
+    page model, i.e. those for its content type and that of its parents.
+    """
+    invalidate(get_content_type_ids(model))
+
+
+def invalidate_page(page):
+    """
+    Invalidate all cached results that may contain the given page, also
+    when it is not a specific page instance.
+    """
+    invalidate(get_page_content_type_ids(page))
+
+
+def get_stats():
+    """
+    Return the number of cache hits and misses, to help sizing the cache.
+    """
+    stats = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    return {
+        'hits': stats.get(HITS_KEY, 0),
+        'misses': stats.get(MISSES_KEY, 0),
+    }
@@ -0,0 +1,386 @@
+from __future__ import absolute_import, unicode_literals
+
+import json
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import IntegerField, Max
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from wagtailreports.models import report_evaluated
+from wagtailreports.rows import ReportRow
+from wagtailreports.timeouts import ReportTimeout, time_budget
+from wagtailreports.utils import count_queries
+
+WINDOW_COUNT_ANNOTATION = 'wagtailreports_total_count'
+
+
+def supports_window_functions(connection):
+    """
+    Whether the database supports ``COUNT(*) OVER ()``.
+    """
+    supported = getattr(connection.features, 'supports_over_clause', None)
+    if supported is not None:
+        return supported
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 25, 0)
+    return False
+
+
+def use_window_count(queryset):
+    """
+    Whether the total count can be fetched together with the list, set
+    ``WAGTAILREPORTS_WINDOW_COUNT = False`` to always use a separate query.
+    """
+    return (
+        getattr(settings, 'WAGTAILREPORTS_WINDOW_COUNT', True)
+        and supports_window_functions(connections[queryset.db])
+    )
+
+
+def window_count(enabled=True):
+    """
+    Expression annotating each row with the number of rows matching the
+    query before slicing. Disabled, it selects NULL instead so querysets
+    can still be combined with querysets using the real count.
+    """
+    return RawSQL('COUNT(*) OVER ()' if enabled else 'NULL', (), output_field=IntegerField())
+
+
+def get_count_cap():
+    return getattr(settings, 'WAGTAILREPORTS_COUNT_CAP', 1000)
+
+
+def capped_count(queryset, cap=None):
+    """
+    Count the rows of a queryset up to one more than ``cap``, using a
+    ``LIMIT`` subquery so the database can stop early.
+    """
+    if cap is None:
+        cap = get_count_cap()
+    return queryset.values('pk')[:cap + 1].count()
+
+
+def planner_plan(queryset):
+    """
+    Return the top node of the PostgreSQL query plan of the queryset.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def planner_estimate(queryset):
+    """
+    Return the number of rows the PostgreSQL planner estimates the queryset
+    to return.
+    """
+    return int(planner_plan(queryset)['Plan Rows'])
+
+
+def estimate_cost(queryset, base_queryset):
+    """
+    Return the estimated number of rows of a queryset and the planner's
+    total cost of it, the cost is None on databases other than PostgreSQL.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = planner_plan(queryset)
+        return int(plan['Plan Rows']), float(plan['Total Cost'])
+    return sampled_estimate(queryset, base_queryset), None
+
+
+def sampled_estimate(queryset, base_queryset, sample_size=None):
+    """
+    Estimate the number of rows of a queryset from the matches among the
+    first ``sample_size`` rows of ``base_queryset`` by primary key,
+    extrapolated over the whole range of primary keys.
+    """
+    if sample_size is None:
+        sample_size = getattr(settings, 'WAGTAILREPORTS_COUNT_SAMPLE_SIZE', 10000)
+    boundary = list(base_queryset.order_by('pk').values_list('pk', flat=True)[sample_size - 1:sample_size])
+    if not boundary:
+        # Fewer rows than the sample size
+        return queryset.count()
+    max_pk = base_queryset.aggregate(max_pk=Max('pk'))['max_pk']
+    matches = queryset.filter(pk__lte=boundary[0]).count()
+    return int(round(matches * float(max_pk) / boundary[0]))
+
+
+def estimated_count(queryset, base_queryset):
+    """
+    Estimate the number of rows of a queryset, from the planner's estimate on
+    PostgreSQL and by sampling elsewhere.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        return planner_estimate(queryset)
+    return sampled_estimate(queryset, base_queryset)
+
+
+class ReportResult(object):
+    """
+    The lazily evaluated results of a report.
+
+    Both the list and the total count are computed on first access only and
+    are kept for the lifetime of the object. Where the database supports
+    window functions an exact count is fetched in the same statement as the
+    list, estimated and capped counts are fetched separately.
+
+    The list holds page instances, or :class:`~wagtailreports.rows.ReportRow`
+    objects when ``as_rows`` is True. For backwards compatibility the result
+    can also be accessed like the dictionary ``results()`` used to return,
+    e.g. ``result['list']``.
+    """
+    # Whether the list and count were loaded from the result cache, and
+    # whether they are outdated, see AbstractReport.max_staleness
+    from_cache = False
+    is_stale = False
+    # Whether evaluating took longer than the time budget of the report,
+    # and whether the report is suspended, see circuit_breaker
+    timed_out = False
+    suspended = False
+    # Number of seconds spent in and number of queries run for this result,
+    # reports evaluated in the same query share its duration and count
+    duration = 0.0
+    query_count = 0
+    # Whether the result was evaluated together with those of other reports,
+    # so its duration is a share of theirs rather than its own
+    batched = False
+
+    def __init__(self, report, now=None, as_rows=False):
+        self.report = report
+        self.now = now or timezone.now()
+        self.as_rows = as_rows
+
+    @cached_property
+    def queryset(self):
+        return self.report.get_queryset(self.now)
+
+    @cached_property
+    def listing_queryset(self):
+        return self.report.get_listing_queryset(self.queryset)
+
+    @cached_property
+    def listing_fields(self):
+        return self.report.get_listing_fields(self.queryset.model)
+
+    def prepare(self, queryset, annotations=()):
+        """
+        Prepare a listing queryset for :meth:`build`, selecting just the
+        listing fields and annotations, and the given annotations when
+        listing rows.
+        """
+        if self.as_rows:
+            annotations = self.report.listing_annotations + tuple(annotations)
+            return ReportRow.prepare(queryset, self.listing_fields, annotations)
+        return queryset
+
+    def build(self, queryset, annotations=()):
+        """
+        Evaluate a queryset prepared with :meth:`prepare` into a list of
+        pages or rows.
+        """
+        if self.as_rows:
+            annotations = self.report.listing_annotations + tuple(annotations)
+            return ReportRow.build(queryset, self.listing_fields, annotations)
+        return list(queryset)
+
+    @property
+    def needs_count(self):
+        return self.report.total_count and not self.is_counted
+
+    @property
+    def needs_exact_count(self):
+        return self.needs_count and not self.report.count_mode
+
+    @property
+    def uses_window_count(self):
+        # The count is read from the rows, which count-only reports have none of
+        return self.needs_exact_count and self.report.list_length > 0 and use_window_count(self.queryset)
+
+    @property
+    def is_estimated(self):
+        return self.report.count_mode == self.report.ESTIMATED and self.count is not None
+
+    @property
+    def is_capped(self):
+        return self.report.count_mode == self.report.CAPPED and self.count is not None and self.count > get_count_cap()
+
+    @property
+    def display_count(self):
+        """
+        The count to display, capped counts above the cap display the cap.
+        """
+        return get_count_cap() if self.is_capped else self.count
+
+    @cached_property
+    def list(self):
+        self.evaluate()
+        return self.list
+
+    @cached_property
+    def count(self):
+        if not self.report.total_count:
+            return None
+        self.evaluate()
+        return self.count
+
+    def fetch_list(self):
+        """
+        Fetch the list, along with the total count if the database supports
+        window functions.
+        """
+        queryset = self.listing_queryset
+        annotations = []
+        uses_window_count = self.uses_window_count
+        if uses_window_count:
+            queryset = queryset.annotate(**{WINDOW_COUNT_ANNOTATION: window_count()})
+            annotations.append(WINDOW_COUNT_ANNOTATION)
+        queryset = self.prepare(queryset, annotations)[:self.report.list_length]
+        self.set_list(self.build(queryset, annotations), uses_window_count)
+
+    def set_list(self, rows, with_window_count=False):
+        """
+        Hand in the list, e.g. by a batch evaluator. Pass
+        ``with_window_count=True`` if the rows are annotated with the
+        window count, in which case no separate count query is needed.
+        """
+        self.list = rows
+        if with_window_count:
+            self.count = getattr(rows[0], WINDOW_COUNT_ANNOTATION) if rows else 0
+
+    @property
+    def is_listed(self):
+        """
+        Whether the list has been evaluated (or handed in by a batch evaluator).
+        """
+        return 'list' in self.__dict__
+
+    @property
+    def is_counted(self):
+        """
+        Whether the total count is known, without running a query for it.
+        """
+        return 'count' in self.__dict__
+
+    @property
+    def is_evaluated(self):
+        return self.is_listed and not self.needs_count
+
+    def evaluate(self, use_cache=True):
+        """
+        Evaluate the list and, if the report displays it, the total count,
+        unless they are known already. Results are shared between users
+        through the result cache, see :mod:`wagtailreports.result_cache`.
+        Suspended reports are not evaluated, see
+        :mod:`wagtailreports.circuit_breaker`.
+        """
+        from wagtailreports import circuit_breaker, result_cache
+
+        if self.is_evaluated:
+            return
+        if not use_cache:
+            self.compute()
+            return
+        cache_hit = bool(result_cache.load([self]) or circuit_breaker.load([self]))
+        if not cache_hit:
+            pending, locks = result_cache.single_flight([self])
+            cache_hit = not pending
+        if not cache_hit:
+            try:
+                self.compute()
+                circuit_breaker.record([self])
+                result_cache.store([self])
+            finally:
+                result_cache.release(locks)
+        self.send_evaluated(cache_hit)
+
+    def compute(self):
+        """
+        Run the queries for whatever is not known yet, within the time
+        budget of the report.
+        """
+        from wagtailreports import counters
+
+        if self.timed_out:
+            return
+        start = time.time()
+        try:
+            with count_queries(connections[self.queryset.db]) as queries:
+                with time_budget(self.report.get_time_budget(), self.queryset.db):
+                    if self.needs_count:
+                        counters.load([self])
+                    if not self.is_listed:
+                        self.fetch_list()
+                    if self.needs_count:
+                        self.count = self.fetch_count()
+        except ReportTimeout:
+            self.time_out()
+        finally:
+            self.duration += time.time() - start
+            self.query_count += queries['count']
+
+    def time_out(self):
+        """
+        Give up on evaluating, falling back on the last result in the result
+        cache if there is one and on an empty list otherwise.
+        """
+        from wagtailreports import result_cache
+
+        self.timed_out = True
+        if not result_cache.load_last([self]):
+            self.list = []
+            self.count = None
+
+    def send_evaluated(self, cache_hit):
+        """
+        Send the ``report_evaluated`` signal with the measurements of this
+        result, once it has been evaluated or found in a cache.
+        """
+        report_evaluated.send(
+            sender=type(self.report),
+            result=self,
+            duration=self.duration,
+            queries=self.query_count,
+            rows=len(self.list),
+            cache_hit=cache_hit,
+        )
+
+    def fetch_count(self):
+        """
+        Count the results the way the count mode of the report specifies.
+        """
+        if self.report.count_mode == self.report.CAPPED:
+            return capped_count(self.queryset)
+        if self.report.count_mode == self.report.ESTIMATED:
+            return estimated_count(self.queryset, self.report.get_base_queryset())
+        return self.queryset.count()
+
+    def __getitem__(self, key):
+        if key == 'list' or (key == 'count' and self.report.total_count):
+            return getattr(self, key)
+        raise KeyError(key)
+
+
+def share_results(reports, now=None, as_rows=False):
+    """
+    Make all instances of the same report share one ReportResult, so a
+    report that is displayed in several panels is evaluated only once.
+    Periods of new results are relative to ``now``, and they list rows
+    instead of pages when ``as_rows`` is True.
+    """
+    results = {}
+    for report in reports:
+        if report.pk not in results:
+            results[report.pk] = report._report_result or ReportResult(report, now, as_rows)
+        report._report_result = results[report.pk]
+    return results
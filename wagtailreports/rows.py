@@ -0,0 +1,215 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.utils.translation import ugettext as _
+from wagtail.wagtailcore.models import PageRevision, PageViewRestriction, Site
+
+
+def get_page_url(url_path, site_root_paths=None):
+    """
+    Return the URL of a page by its ``url_path``, the way ``Page.url`` does:
+    relative if there is only one site and absolute otherwise.
+    """
+    if site_root_paths is None:
+        site_root_paths = Site.get_site_root_paths()
+    for site_id, root_path, root_url in site_root_paths:
+        if url_path.startswith(root_path):
+            page_path = reverse('wagtail_serve', args=(url_path[len(root_path):],))
+            # Remove the trailing slash from the URL reverse generates if WAGTAIL_APPEND_SLASH is False
+            if not getattr(settings, 'WAGTAIL_APPEND_SLASH', True) and page_path != '/':
+                page_path = page_path.rstrip('/')
+            if len(site_root_paths) == 1:
+                return page_path
+            return root_url + page_path
+
+
+def get_restricted_paths():
+    """
+    Return the paths of all pages with a view restriction, pages below them
+    are private too.
+    """
+    return list(PageViewRestriction.objects.values_list('page__path', flat=True))
+
+
+def annotate(rows):
+    """
+    Look up what the listing template needs beyond the row values for all
+    given rows at once: whether they are private, whether they have an
+    approved schedule, the site root paths for their URLs and the users who
+    last edited them. Rendering the rows then takes no further queries.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    restricted_paths = get_restricted_paths()
+    scheduled = set(PageRevision.objects.filter(
+        page_id__in=set(row.id for row in rows),
+        approved_go_live_at__isnull=False,
+    ).values_list('page_id', flat=True))
+    site_root_paths = Site.get_site_root_paths()
+    user_ids = dict((row, row.annotations.get('latest_revision_user_id')) for row in rows)
+    users = get_user_model().objects.in_bulk(set(user_id for user_id in user_ids.values() if user_id is not None))
+    for row in rows:
+        row.is_private = any(row.path.startswith(path) for path in restricted_paths)
+        row.approved_schedule = row.id in scheduled
+        row._site_root_paths = site_root_paths
+        row.latest_revision_user = users.get(user_ids[row])
+
+
+class ReportRow(object):
+    """
+    A compact, read-only stand-in for a page in report listings, built from
+    a ``values_list`` tuple instead of a model instance. It provides the
+    attributes and methods the listing templates use.
+
+    Values of annotations the row was fetched with are available as
+    attributes too. Privacy, schedule and URL are looked up lazily, use
+    :func:`annotate` to look them up for many rows at once.
+    """
+    fields = (
+        'id',
+        'title',
+        'draft_title',
+        'live',
+        'expired',
+        'has_unpublished_changes',
+        'locked',
+        'path',
+        'depth',
+        'url_path',
+        'go_live_at',
+        'expire_at',
+        'latest_revision_created_at',
+    )
+    __slots__ = fields + (
+        'annotations', '_is_private', '_approved_schedule', '_site_root_paths', '_latest_revision_user',
+    )
+
+    def __init__(self, values, annotations=None):
+        for name in self.fields:
+            setattr(self, name, values.get(name))
+        self.annotations = annotations or {}
+        self._is_private = None
+        self._approved_schedule = None
+        self._site_root_paths = None
+        self._latest_revision_user = None
+
+    @classmethod
+    def prepare(cls, queryset, fields, annotations=()):
+        """
+        Turn a queryset of pages into one of tuples for :meth:`build`.
+        """
+        return queryset.values_list(*(list(fields) + list(annotations)))
+
+    @classmethod
+    def build(cls, tuples, fields, annotations=()):
+        """
+        Return rows for the tuples of a queryset prepared with :meth:`prepare`.
+        """
+        fields = list(fields)
+        annotations = list(annotations)
+        return [
+            cls(dict(zip(fields, values)), dict(zip(annotations, values[len(fields):])))
+            for values in tuples
+        ]
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set
+        try:
+            return object.__getattribute__(self, 'annotations')[name]
+        except (AttributeError, KeyError):
+            raise AttributeError(name)
+
+    def __getstate__(self):
+        # Looked up values are left out, they may change without the page
+        values = dict((name, getattr(self, name)) for name in self.fields)
+        return values, self.annotations
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __eq__(self, other):
+        return isinstance(other, ReportRow) and self.id == other.id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return '<ReportRow: %s>' % self.id
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_admin_display_title(self):
+        return self.draft_title or self.title
+
+    @property
+    def is_private(self):
+        if self._is_private is None:
+            self._is_private = any(self.path.startswith(path) for path in get_restricted_paths())
+        return self._is_private
+
+    @is_private.setter
+    def is_private(self, value):
+        self._is_private = value
+
+    @property
+    def approved_schedule(self):
+        if self._approved_schedule is None:
+            self._approved_schedule = PageRevision.objects.filter(
+                page_id=self.id
+            ).exclude(approved_go_live_at__isnull=True).exists()
+        return self._approved_schedule
+
+    @approved_schedule.setter
+    def approved_schedule(self, value):
+        self._approved_schedule = value
+
+    @property
+    def latest_revision_user(self):
+        user_id = self.annotations.get('latest_revision_user_id')
+        if self._latest_revision_user is None and user_id is not None:
+            self._latest_revision_user = get_user_model().objects.filter(pk=user_id).first()
+        return self._latest_revision_user
+
+    @latest_revision_user.setter
+    def latest_revision_user(self, value):
+        self._latest_revision_user = value
+
+    @property
+    def latest_revision_user_name(self):
+        """
+        Name of the user who last edited the page, their username if their
+        full name is blank.
+        """
+        user = self.latest_revision_user
+        if user is None:
+            return None
+        return user.get_full_name().strip() or user.get_username()
+
+    @property
+    def status_string(self):
+        if not self.live:
+            if self.expired:
+                return _("expired")
+            elif self.approved_schedule:
+                return _("scheduled")
+            else:
+                return _("draft")
+        else:
+            if self.approved_schedule:
+                return _("live + scheduled")
+            elif self.has_unpublished_changes:
+                return _("live + draft")
+            else:
+                return _("live")
+
+    @property
+    def url(self):
+        return get_page_url(self.url_path, self._site_root_paths)
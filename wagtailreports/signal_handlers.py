@@ -0,0 +1,82 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save, pre_save
+from wagtail.wagtailcore.models import Page
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+
+from wagtailreports import circuit_breaker, counters, metrics, result_cache, snapshots, statistics
+from wagtailreports.models import (
+    ReportSnapshot, get_report_model, page_state_fields, report_evaluated)
+
+
+def is_specific_page(instance):
+    # Deleting a page also sends signals for the rows of its parent models
+    return (
+        isinstance(instance, Page)
+        and instance.content_type_id == ContentType.objects.get_for_model(type(instance)).pk
+    )
+
+
+def page_saving(sender, instance, **kwargs):
+    if (snapshots.is_enabled() or counters.is_enabled()) and isinstance(instance, Page) and instance.pk:
+        instance._wagtailreports_old_state = Page.objects.filter(pk=instance.pk).values(*page_state_fields).first()
+
+
+def page_changed(sender, instance, **kwargs):
+    # Saving also covers locking and unlocking pages
+    if isinstance(instance, Page):
+        result_cache.invalidate_page(instance)
+        old_state = getattr(instance, '_wagtailreports_old_state', None)
+        if counters.is_enabled():
+            counters.page_saved(instance, old_state, kwargs.get('created', False))
+        if snapshots.is_enabled():
+            snapshots.page_changed(instance, old_state)
+
+
+def page_published_or_unpublished(sender, instance, **kwargs):
+    # The page has been saved already, so snapshots are up to date
+    result_cache.invalidate_page(instance)
+
+
+def page_deleted(sender, instance, **kwargs):
+    if is_specific_page(instance):
+        result_cache.invalidate_page(instance)
+        if counters.is_enabled():
+            counters.page_deleted(instance)
+        if snapshots.is_enabled():
+            snapshots.page_changed(instance, snapshots.get_page_state(instance))
+
+
+def report_changed(sender, instance, **kwargs):
+    if instance.content_type_id is not None:
+        result_cache.invalidate([instance.content_type_id])
+
+
+def report_saved(sender, instance, **kwargs):
+    report_changed(sender, instance, **kwargs)
+    # Give changed reports a new chance
+    circuit_breaker.resume(instance.pk)
+    if snapshots.is_enabled():
+        if snapshots.can_snapshot(instance):
+            snapshots.update(instance)
+        else:
+            ReportSnapshot.objects.filter(report=instance).delete()
+
+
+def register_signal_handlers():
+    Report = get_report_model()
+
+    pre_save.connect(page_saving, dispatch_uid='wagtailreports_page_saving')
+    post_save.connect(page_changed, dispatch_uid='wagtailreports_page_saved')
+    post_delete.connect(page_deleted, dispatch_uid='wagtailreports_page_deleted')
+    page_published.connect(page_published_or_unpublished, dispatch_uid='wagtailreports_page_published')
+    page_unpublished.connect(page_published_or_unpublished, dispatch_uid='wagtailreports_page_unpublished')
+
+    report_evaluated.connect(statistics.report_evaluated, dispatch_uid='wagtailreports_report_evaluated')
+    report_evaluated.connect(metrics.report_evaluated, dispatch_uid='wagtailreports_report_metrics')
+    request_finished.connect(statistics.request_finished, dispatch_uid='wagtailreports_flush_statistics')
+
+    post_save.connect(report_saved, sender=Report)
+    post_delete.connect(report_changed, sender=Report)
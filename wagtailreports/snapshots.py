@@ -0,0 +1,107 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.conf import settings
+
+from wagtailreports.models import ReportSnapshot, get_report_model, page_state_fields
+from wagtailreports.results import ReportResult
+from wagtailreports.utils import get_page_content_type_ids
+
+
+def is_enabled():
+    """
+    Whether reports without periods are read from snapshots, enable with
+    ``WAGTAILREPORTS_SNAPSHOTS = True``. Snapshots are kept up to date from
+    page signals, so pages changed through ``QuerySet.update()`` are missed.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_SNAPSHOTS', False)
+
+
+def can_snapshot(report):
+    # Results of reports with periods change as time passes
+    return report.content_type_id is not None and not report.has_periods()
+
+
+def update(report):
+    """
+    Evaluate a report and save its snapshot.
+    """
+    result = ReportResult(report)
+    snapshot = ReportSnapshot(report=report)
+    snapshot.set_page_ids(result.queryset.values_list('pk', flat=True)[:report.list_length])
+    snapshot.count = result.fetch_count() if report.total_count else None
+    snapshot.save()
+    return snapshot
+
+
+def load(results):
+    """
+    Hand the list and count from the snapshot of their report to each of
+    the given results, with a single query for the pages of all reports on
+    the same content type. Returns the results that had a snapshot.
+    """
+    results = [result for result in results if can_snapshot(result.report)]
+    if not is_enabled() or not results:
+        return []
+
+    snapshots = ReportSnapshot.objects.in_bulk([result.report.pk for result in results])
+    results = [result for result in results if result.report.pk in snapshots]
+
+    page_ids = {}
+    for result in results:
+        page_ids.setdefault((result.report.content_type_id, result.as_rows), set()).update(
+            snapshots[result.report.pk].get_page_ids()
+        )
+    pages = {}
+    for result in results:
+        key = (result.report.content_type_id, result.as_rows)
+        if key not in pages:
+            queryset = result.report.get_listing_queryset(result.report.get_base_queryset())
+            pages[key] = dict(
+                (page.pk, page)
+                for page in result.build(result.prepare(queryset.filter(pk__in=list(page_ids[key]))))
+            )
+
+    for result in results:
+        key = (result.report.content_type_id, result.as_rows)
+        result.list = [
+            pages[key][page_id] for page_id in snapshots[result.report.pk].get_page_ids()
+            if page_id in pages[key]
+        ]
+        if result.report.total_count:
+            result.count = snapshots[result.report.pk].count
+    return results
+
+
+def store(results):
+    """
+    Save snapshots of the given evaluated results.
+    """
+    if not is_enabled():
+        return
+
+    for result in results:
+        if can_snapshot(result.report) and result.is_evaluated and not result.timed_out:
+            snapshot = ReportSnapshot(report=result.report, count=result.count)
+            snapshot.set_page_ids(page.pk for page in result.list)
+            snapshot.save()
+
+
+def get_page_state(page):
+    return dict((name, getattr(page, name)) for name in page_state_fields)
+
+
+def page_changed(page, old_state=None):
+    """
+    Update the snapshots of the reports the page matched before or matches
+    after it changed. Pass the state of the page before it changed as
+    returned by :func:`get_page_state`, or None for new pages.
+    """
+    reports = get_report_model().objects.filter(
+        content_type_id__in=get_page_content_type_ids(page),
+        go_live_at='',
+        expire_at='',
+    )
+    state = get_page_state(page)
+    for report in reports:
+        if report.matches(state) or (old_state is not None and report.matches(old_state)):
+            update(report)
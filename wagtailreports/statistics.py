@@ -0,0 +1,93 @@
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from wagtailreports.models import ReportStatistics, get_report_model
+
+# Measurements not written to the database yet, by report id
+buffer = {}
+buffer_lock = threading.Lock()
+last_flush = [time.time()]
+
+
+def is_enabled():
+    """
+    Whether evaluation statistics are kept, disable with
+    ``WAGTAILREPORTS_STATISTICS = False``.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_STATISTICS', True)
+
+
+def get_flush_interval():
+    """
+    Number of seconds measurements are buffered in the process before they
+    are written to the database, at the end of the next request. Set
+    ``WAGTAILREPORTS_STATISTICS_FLUSH_INTERVAL = None`` to only write them
+    when :func:`flush` is called. Measurements still in the buffer when the
+    process exits are lost.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_STATISTICS_FLUSH_INTERVAL', 60)
+
+
+def get_sample_size():
+    """
+    Number of recent durations kept per report to compute percentiles from.
+    """
+    return getattr(settings, 'WAGTAILREPORTS_STATISTICS_SAMPLES', 100)
+
+
+def report_evaluated(sender, result, duration, queries, rows, cache_hit, **kwargs):
+    if not is_enabled() or result.report.pk is None:
+        return
+
+    with buffer_lock:
+        entry = buffer.setdefault(result.report.pk, {
+            'evaluations': 0,
+            'cache_hits': 0,
+            'queries': 0,
+            'rows': 0,
+            'durations': [],
+        })
+        entry['evaluations'] += 1
+        entry['queries'] += queries
+        entry['rows'] += rows
+        if cache_hit:
+            entry['cache_hits'] += 1
+        else:
+            entry['durations'].append(duration * 1000)
+
+
+def request_finished(sender, **kwargs):
+    # Written once the response has been sent, not while evaluating reports
+    interval = get_flush_interval()
+    if interval is not None and time.time() - last_flush[0] >= interval:
+        flush()
+
+
+def flush():
+    """
+    Add the buffered measurements to the statistics of their reports.
+    """
+    with buffer_lock:
+        entries = dict(buffer)
+        buffer.clear()
+        last_flush[0] = time.time()
+    if not entries:
+        return
+
+    # Reports may have been deleted in the meantime
+    report_ids = get_report_model().objects.filter(pk__in=list(entries)).values_list('pk', flat=True)
+    for report_id in report_ids:
+        entry = entries[report_id]
+        with transaction.atomic():
+            statistics, created = ReportStatistics.objects.select_for_update().get_or_create(report_id=report_id)
+            statistics.evaluations += entry['evaluations']
+            statistics.cache_hits += entry['cache_hits']
+            statistics.queries += int(round(entry['queries']))
+            statistics.rows += entry['rows']
+            statistics.set_durations((statistics.get_durations() + entry['durations'])[-get_sample_size():])
+            statistics.save()
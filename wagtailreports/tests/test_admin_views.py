@@ -4,17 +4,23 @@ import json
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.urlresolvers import reverse
+from django.forms.models import model_to_dict
+from django.db import DatabaseError, connection
 from django.test import TestCase
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils.six import b
 
 from wagtail.tests.testapp.models import EventPage, EventPageRelatedLink
 from wagtail.tests.utils import WagtailTestUtils
-from wagtail.wagtailcore.models import Page
-from wagtailreports import models
+from wagtail.wagtailcore.models import Page, PageViewRestriction
+from wagtailreports import circuit_breaker, models
+from wagtailreports.evaluation import supports_compound_slicing
+from wagtailreports.forms import get_report_form
+from wagtailreports.fragments import render_reports
 
 
 class TestReportIndexView(TestCase, WagtailTestUtils):
@@ -27,6 +33,16 @@ class TestReportIndexView(TestCase, WagtailTestUtils):
         self.assertTemplateUsed(response, 'wagtailreports/reports/index.html')
         self.assertContains(response, "Add a report")
 
+    def test_suspended_reports(self):
+        report = models.Report.objects.create(title="Slow report")
+        circuit_breaker.suspend([report.pk])
+        try:
+            response = self.client.get(reverse('wagtailreports:index'))
+        finally:
+            circuit_breaker.resume(report.pk)
+        self.assertEqual(list(response.context['suspended_reports']), [report])
+        self.assertContains(response, reverse('wagtailreports:edit', args=(report.id,)))
+
     def test_search(self):
         response = self.client.get(reverse('wagtailreports:index'), {'q': "Hello"})
         self.assertEqual(response.status_code, 200)
@@ -80,6 +96,145 @@ class TestReportIndexView(TestCase, WagtailTestUtils):
             self.assertEqual(response.status_code, 200)
 
 
+# Statistics are written at the end of requests when due, not counted here
+@override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=0, WAGTAILREPORTS_STATISTICS_FLUSH_INTERVAL=None)
+class TestReportPanelQueries(TestCase, WagtailTestUtils):
+    def setUp(self):
+        self.user = self.login()
+        root_page = Page.objects.get(id=2)
+        for i in range(10):
+            root_page.add_child(instance=Page(title="Page %d" % i, slug="page-%d" % i, live=True))
+        PageViewRestriction.objects.create(page=root_page.get_children().first(), password="secret")
+        self.panel = models.ReportPanel.objects.create(title="Panel")
+        self.panel.for_users.add(self.user)
+
+    def add_reports(self, number):
+        content_type = ContentType.objects.get_for_model(Page)
+        for i in range(number):
+            self.panel.reports.add(models.Report.objects.create(
+                title="Report %d" % i, content_type=content_type, live=True, list_length=10, total_count=True))
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('wagtailadmin_home'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_independent_of_rows(self):
+        if not supports_compound_slicing(Page.objects.all()):
+            self.skipTest("Database does not support LIMIT in compound statements")
+
+        self.add_reports(1)
+        queries = self.count_queries()
+        self.add_reports(4)
+        self.assertEqual(self.count_queries(), queries)
+
+    def test_privacy_indicator(self):
+        self.add_reports(1)
+        response = self.client.get(reverse('wagtailadmin_home'))
+        self.assertContains(response, "privacy-indicator", count=1)
+
+    def test_last_edited(self):
+        self.add_reports(1)
+        Page.objects.get(slug="page-3").save_revision(user=self.user)
+        response = self.client.get(reverse('wagtailadmin_home'))
+        self.assertContains(response, "human-readable-date")
+        self.assertContains(response, "by %s" % self.user.get_username())
+
+
+@override_settings(WAGTAILREPORTS_ASYNC_PANELS=True, WAGTAILREPORTS_CACHE_TIMEOUT=0)
+class TestReportFragmentView(TestCase, WagtailTestUtils):
+    def setUp(self):
+        self.user = self.login()
+        self.report = models.Report.objects.create(
+            title="Live pages", content_type=ContentType.objects.get_for_model(Page), live=True)
+        self.panel = models.ReportPanel.objects.create(title="Panel")
+        self.panel.reports.add(self.report)
+
+    def test_dashboard_renders_placeholders(self):
+        self.panel.for_users.add(self.user)
+        response = self.client.get(reverse('wagtailadmin_home'))
+        self.assertContains(response, reverse('wagtailreports:fragment', args=(self.report.id,)))
+        # The stylesheet mentions the class of the listing, its markup is absent
+        self.assertNotContains(response, '<table class="listing report-listing')
+
+    def test_fragment(self):
+        self.panel.for_users.add(self.user)
+        response = self.client.get(reverse('wagtailreports:fragment', args=(self.report.id,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'wagtailreports/homepage/_report.html')
+        self.assertContains(response, '<table class="listing report-listing')
+
+    def test_fragment_of_report_not_in_panel(self):
+        response = self.client.get(reverse('wagtailreports:fragment', args=(self.report.id,)))
+        self.assertRedirects(response, reverse('wagtailadmin_home'))
+
+
+@override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=60)
+class TestReportFragmentCache(TestCase):
+    def setUp(self):
+        self.report = models.Report.objects.create(
+            title="Live pages", content_type=ContentType.objects.get_for_model(Page), live=True)
+
+    def get_report(self):
+        # A fresh instance, as another request would have
+        return models.Report.objects.get(pk=self.report.pk)
+
+    def render(self, report=None):
+        report = report or self.get_report()
+        return render_reports([report])[report.pk]
+
+    def test_fragment_cached(self):
+        fragment = self.render()
+        report = self.get_report()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(report), fragment)
+
+    def test_invalidated_by_page_changes(self):
+        self.render()
+        page = Page.objects.get(id=2)
+        page.title = page.draft_title = "Changed title"
+        page.save()
+        self.assertIn("Changed title", self.render())
+
+    def test_invalidated_by_report_changes(self):
+        self.render()
+        self.report.title = "Changed report"
+        self.report.save()
+        self.assertIn("Changed report", self.render())
+
+
+@override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=0)
+class TestMetricsView(TestCase, WagtailTestUtils):
+    def setUp(self):
+        self.user = self.login()
+
+    def test_metrics(self):
+        report = models.Report.objects.create(
+            title="Live pages", content_type=ContentType.objects.get_for_model(Page), live=True)
+        panel = models.ReportPanel.objects.create(title="Panel")
+        panel.reports.add(report)
+        panel.for_users.add(self.user)
+        self.client.get(reverse('wagtailadmin_home'))
+
+        response = self.client.get(reverse('wagtailreports:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        content = response.content.decode('utf-8')
+        self.assertIn('wagtailreports_evaluation_seconds_count{report="%d"}' % report.pk, content)
+        self.assertIn('wagtailreports_panel_render_seconds_bucket{le="+Inf"}', content)
+        self.assertIn('wagtailreports_cache_requests_total{result="miss"}', content)
+        self.assertIn('wagtailreports_cache_hit_ratio', content)
+
+    def test_superusers_only(self):
+        user = get_user_model().objects.create_user(username='editor', email='editor@example.com', password='password')
+        user.user_permissions.add(Permission.objects.get(codename='access_admin'))
+        self.client.login(username='editor', password='password')
+
+        response = self.client.get(reverse('wagtailreports:metrics'))
+        self.assertRedirects(response, reverse('wagtailadmin_home'))
+
+
 class TestReportAddView(TestCase, WagtailTestUtils):
     def setUp(self):
         self.login()
@@ -111,6 +266,61 @@ class TestReportAddView(TestCase, WagtailTestUtils):
         self.assertTrue(models.Report.objects.filter(title="Test report").exists())
 
 
+class TestReportCostGuardrail(TestCase, WagtailTestUtils):
+    def setUp(self):
+        self.report = models.Report.objects.create(
+            title="Live pages", content_type=ContentType.objects.get_for_model(Page), live=True)
+        self.editor = get_user_model().objects.create_user(
+            username='editor', email='editor@example.com', password='password')
+
+    def get_form(self, user):
+        ReportForm = get_report_form(models.Report)
+        data = dict(
+            (name, value) for name, value in model_to_dict(self.report, ReportForm._meta.fields).items()
+            if value is not None
+        )
+        return ReportForm(data, instance=self.report, user=user)
+
+    def test_preview(self):
+        form = self.get_form(self.editor)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.preview['rows'], Page.objects.filter(live=True).count())
+        self.assertTrue(form.preview['list'])
+
+    @override_settings(WAGTAILREPORTS_ROW_THRESHOLD=0)
+    def test_expensive_report_rejected(self):
+        form = self.get_form(self.editor)
+        self.assertFalse(form.is_valid())
+        self.assertIn("more than the limit of 0", form.non_field_errors()[0])
+        self.assertNotIn("query cost", form.non_field_errors()[0])
+
+    @override_settings(WAGTAILREPORTS_ROW_THRESHOLD=0)
+    def test_failed_estimate(self):
+        form = self.get_form(self.editor)
+
+        def get_preview(report):
+            raise DatabaseError("canceling statement due to statement timeout")
+        form.get_preview = get_preview
+
+        with self.assertLogs('wagtailreports', 'WARNING'):
+            self.assertTrue(form.is_valid())
+        self.assertTrue(form.preview_failed)
+
+    @override_settings(WAGTAILREPORTS_ROW_THRESHOLD=0)
+    def test_expensive_report_with_permission(self):
+        self.editor.user_permissions.add(Permission.objects.get(codename='save_expensive_report'))
+        editor = get_user_model().objects.get(pk=self.editor.pk)
+        self.assertTrue(self.get_form(editor).is_valid())
+
+    def test_preview_button(self):
+        self.login()
+        post_data = self.get_form(None).data
+        post_data['preview'] = '1'
+        response = self.client.post(reverse('wagtailreports:edit', args=(self.report.id,)), post_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "This report is estimated to return")
+
+
 class TestReportEditView(TestCase, WagtailTestUtils):
     def setUp(self):
         self.login()
@@ -164,6 +374,30 @@ class TestReportEditView(TestCase, WagtailTestUtils):
         self.assertContains(response, 'File not found')
 
 
+class TestReportProfileView(TestCase, WagtailTestUtils):
+    def setUp(self):
+        self.login()
+        self.report = models.Report.objects.create(
+            title="Live pages", content_type=ContentType.objects.get_for_model(Page), live=True, total_count=True)
+
+    def test_profile(self):
+        response = self.client.get(reverse('wagtailreports:profile', args=(self.report.id,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'wagtailreports/reports/profile.html')
+        self.assertTrue(response.context['profile'].queries)
+        self.assertContains(response, "Download profile")
+
+    def test_download(self):
+        response = self.client.get(reverse('wagtailreports:profile', args=(self.report.id,)), {'download': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="report-%d.prof"' % self.report.id)
+
+    def test_report_without_content_type(self):
+        report = models.Report.objects.create(title="No content type")
+        response = self.client.get(reverse('wagtailreports:profile', args=(report.id,)))
+        self.assertRedirects(response, reverse('wagtailreports:edit', args=(report.id,)))
+
+
 class TestReportDeleteView(TestCase, WagtailTestUtils):
     def setUp(self):
         self.login()
@@ -1,18 +1,31 @@
 from __future__ import absolute_import, unicode_literals
 
-import unittest
+import json
+import pickle
+import time
+from datetime import datetime, timedelta
 
+import mock
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import Group, Permission
-from django.core.files.base import ContentFile
-from django.db import transaction
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import connection, connections
+from django.db.models import Q
 from django.test import TestCase, TransactionTestCase
 from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+from wagtail.tests.testapp.models import EventPage
+from wagtail.wagtailcore.models import Page, Site
 
-from wagtail.wagtailcore.models import GroupCollectionPermission
-from wagtailreports import models, signal_handlers
-from wagtailreports.models import get_report_model
-from wagtail.wagtailimages.tests.utils import get_test_image_file
+from wagtailreports import benchmarks, circuit_breaker, counters, models, result_cache, statistics
+from wagtailreports.evaluation import FilteredCount, evaluate_reports, supports_compound_slicing
+from wagtailreports.results import ReportResult, sampled_estimate, share_results, use_window_count
+from wagtailreports.rows import ReportRow
+from wagtailreports.timeouts import ReportTimeout, time_budget
+from wagtailreports.utils import count_queries
 
 
 class TestReportQuerySet(TestCase):
@@ -24,17 +37,6 @@ class TestReportQuerySet(TestCase):
         results = models.Report.objects.search("Test")
         self.assertEqual(list(results), [report])
 
-    def test_operators(self):
-        aaa_report = models.Report.objects.create(title="AAA Test report")
-        zzz_report = models.Report.objects.create(title="ZZZ Test report")
-
-        results = models.Report.objects.search("aaa test", operator='and')
-        self.assertEqual(list(results), [aaa_report])
-
-        results = models.Report.objects.search("aaa test", operator='or')
-        sorted_results = sorted(results, key=lambda doc: report.title)
-        self.assertEqual(sorted_results, [aaa_report, zzz_report])
-
     def test_custom_ordering(self):
         aaa_report = models.Report.objects.create(title="AAA Test report")
         zzz_report = models.Report.objects.create(title="ZZZ Test report")
@@ -45,6 +47,652 @@ class TestReportQuerySet(TestCase):
         self.assertEqual(list(results), [zzz_report, aaa_report])
 
 
+class TestStringToDatetime(TestCase):
+    def setUp(self):
+        self.now = timezone.make_aware(datetime(2017, 10, 24, 13, 37, 42, 123456), timezone.utc)
+
+    def test_all_periods(self):
+        for period, label in models.Report.PERIOD_CHOICES:
+            start, end = models.string_to_datetime(period, self.now)
+            self.assertLessEqual(start, end)
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_now_midnight(self):
+        start, end = models.string_to_datetime('now-mn', self.now)
+        self.assertEqual(end, timezone.make_aware(datetime(2017, 10, 25), timezone.utc))
+
+    @override_settings(WAGTAILREPORTS_TIME_GRANULARITY=60)
+    def test_quantized(self):
+        start, end = models.string_to_datetime('1h-now', self.now)
+        self.assertEqual(end, timezone.make_aware(datetime(2017, 10, 24, 13, 37), timezone.utc))
+        self.assertEqual(
+            models.string_to_datetime('1h-now', self.now + timedelta(seconds=10)),
+            (start, end)
+        )
+
+
+class TestReportResults(TestCase):
+    def setUp(self):
+        root_page = Page.objects.get(id=2)
+        for i in range(3):
+            root_page.add_child(instance=Page(title="Result page %d" % i, slug="result-page-%d" % i, live=False))
+
+        self.report = models.Report.objects.create(
+            title="Draft pages",
+            content_type=ContentType.objects.get_for_model(Page),
+            live=False,
+            list_length=2,
+            total_count=True,
+        )
+
+    def test_results(self):
+        results = self.report.results()
+        self.assertEqual(len(results.list), 2)
+        self.assertEqual(results.count, 3)
+
+    def test_results_as_dict(self):
+        results = self.report.results()
+        self.assertEqual(results['list'], results.list)
+        self.assertEqual(results['count'], 3)
+
+    def test_no_count_without_total_count(self):
+        self.report.total_count = False
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.report.results().count)
+        with self.assertRaises(KeyError):
+            self.report.results()['count']
+
+    @override_settings(WAGTAILREPORTS_WINDOW_COUNT=False, WAGTAILREPORTS_CACHE_TIMEOUT=0)
+    def test_results_are_memoized(self):
+        with self.assertNumQueries(2):
+            for i in range(3):
+                self.report.results().list
+                self.report.results().count
+
+    @override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=0)
+    def test_list_and_count_in_one_query(self):
+        if not use_window_count(Page.objects.all()):
+            self.skipTest("Database does not support window functions")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.report.results().count, 3)
+            self.assertEqual(len(self.report.results().list), 2)
+
+    @override_settings(WAGTAILREPORTS_WINDOW_COUNT=False, WAGTAILREPORTS_CACHE_TIMEOUT=0)
+    def test_list_and_count_without_window_count(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.report.results().count, 3)
+            self.assertEqual(len(self.report.results().list), 2)
+
+    @override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=0)
+    def test_count_only(self):
+        self.report.list_length = 0
+        result = ReportResult(self.report)
+        self.assertEqual(result.list, [])
+        self.assertEqual(result.count, 3)
+
+    def test_only_listing_fields_loaded(self):
+        page = self.report.results().list[0]
+        deferred_fields = page.get_deferred_fields()
+        self.assertIn('seo_title', deferred_fields)
+        self.assertIn('search_description', deferred_fields)
+        for name in ('title', 'live', 'locked', 'url_path'):
+            self.assertNotIn(name, deferred_fields)
+
+    @override_settings(WAGTAILREPORTS_COUNT_CAP=2)
+    def test_capped_count(self):
+        self.report.count_mode = models.Report.CAPPED
+        results = self.report.results()
+        self.assertTrue(results.is_capped)
+        self.assertEqual(results.display_count, 2)
+        self.assertEqual(len(results.list), 2)
+
+    @override_settings(WAGTAILREPORTS_COUNT_CAP=5)
+    def test_capped_count_below_cap(self):
+        self.report.count_mode = models.Report.CAPPED
+        results = self.report.results()
+        self.assertFalse(results.is_capped)
+        self.assertEqual(results.display_count, 3)
+
+    def test_estimated_count(self):
+        self.report.count_mode = models.Report.ESTIMATED
+        results = self.report.results()
+        self.assertTrue(results.is_estimated)
+        self.assertGreater(results.count, 0)
+
+    def test_sampled_estimate(self):
+        queryset = self.report.get_queryset()
+        self.assertEqual(sampled_estimate(queryset, Page.objects.all(), sample_size=1000), 3)
+        self.assertGreaterEqual(sampled_estimate(queryset, Page.objects.all(), sample_size=3), 0)
+
+    def test_results_are_cached(self):
+        self.report.results().list
+
+        other = models.Report.objects.get(pk=self.report.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(other.results().count, 3)
+            self.assertEqual(other.results().list, self.report.results().list)
+        self.assertTrue(other.results().from_cache)
+
+    def test_cache_invalidated_by_page_change(self):
+        self.report.results().list
+        Page.objects.get(id=2).add_child(instance=Page(title="New draft", slug="new-draft", live=False))
+
+        other = models.Report.objects.get(pk=self.report.pk)
+        self.assertEqual(other.results().count, 4)
+        self.assertFalse(other.results().from_cache)
+
+    def test_cache_invalidated_by_non_specific_page(self):
+        event_page = Page.objects.get(id=2).add_child(instance=EventPage(
+            title="Draft event", slug="draft-event", live=False, date_from=timezone.now().date(),
+            audience='public', location="Here", cost="Free"))
+        self.report.content_type = ContentType.objects.get_for_model(EventPage)
+        self.report.save()
+        self.assertEqual(self.report.results().count, 1)
+
+        # Saving the page as a Page instance invalidates event page results
+        page = Page.objects.get(pk=event_page.pk)
+        page.live = True
+        page.save()
+
+        other = models.Report.objects.get(pk=self.report.pk)
+        self.assertEqual(other.results().count, 0)
+
+    @override_settings(WAGTAILREPORTS_BACKGROUND_REFRESH=False)
+    def test_stale_results(self):
+        self.report.max_staleness = 300
+        self.report.save()
+        self.report.results().list
+        Page.objects.get(id=2).add_child(instance=Page(title="New draft", slug="new-draft", live=False))
+
+        # The outdated result is served, while the report is refreshed
+        other = models.Report.objects.get(pk=self.report.pk)
+        self.assertEqual(other.results().count, 3)
+        self.assertTrue(other.results().is_stale)
+
+        other = models.Report.objects.get(pk=self.report.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(other.results().count, 4)
+        self.assertFalse(other.results().is_stale)
+
+    @override_settings(WAGTAILREPORTS_BACKGROUND_REFRESH=True)
+    def test_background_refresh_lock(self):
+        key = result_cache.get_lock_key(ReportResult(self.report))
+        threads = []
+
+        # The thread is run by hand, the test database is not shared with
+        # the connection of another thread
+        with mock.patch('threading.Thread') as thread_class, \
+                mock.patch.object(ReportResult, 'evaluate'), \
+                mock.patch.object(result_cache, 'connection'):
+            thread_class.side_effect = lambda target: threads.append(target) or mock.Mock()
+            result_cache.refresh(self.report)
+            self.assertNotIn(key, result_cache.get_held_locks())
+            self.assertFalse(result_cache.acquire(key))
+
+            threads[0]()
+        self.assertTrue(result_cache.acquire(key))
+        result_cache.release([key])
+
+    def test_share_results(self):
+        other = models.Report.objects.get(pk=self.report.pk)
+        share_results([self.report, other])
+        self.assertIs(other.results(), self.report.results())
+
+
+class TestEvaluateReports(TestCase):
+    def setUp(self):
+        root_page = Page.objects.get(id=2)
+        for i in range(3):
+            root_page.add_child(instance=Page(title="Live page %d" % i, slug="live-page-%d" % i, live=True))
+            root_page.add_child(instance=Page(title="Draft page %d" % i, slug="draft-page-%d" % i, live=False))
+
+        page_content_type = ContentType.objects.get_for_model(Page)
+        self.live_report = models.Report.objects.create(
+            title="Live pages", content_type=page_content_type, live=True, list_length=2, total_count=True)
+        self.draft_report = models.Report.objects.create(
+            title="Draft pages", content_type=page_content_type, live=False, list_length=10, total_count=True)
+        # The initial data has live pages too
+        self.live_count = Page.objects.filter(live=True).count()
+        self.draft_count = Page.objects.filter(live=False).count()
+
+    def test_evaluate_reports(self):
+        results = evaluate_reports([self.live_report, self.draft_report])
+
+        self.assertEqual(len(results[self.live_report.pk].list), 2)
+        self.assertTrue(all(page.live for page in results[self.live_report.pk].list))
+        self.assertEqual(len(results[self.draft_report.pk].list), self.draft_count)
+        self.assertFalse(any(page.live for page in results[self.draft_report.pk].list))
+        self.assertEqual(results[self.live_report.pk].count, self.live_count)
+        self.assertEqual(results[self.draft_report.pk].count, self.draft_count)
+
+    @override_settings(WAGTAILREPORTS_WINDOW_COUNT=False, WAGTAILREPORTS_CACHE_TIMEOUT=0)
+    def test_counts_in_one_query(self):
+        with self.assertNumQueries(self.get_list_queries() + 1):
+            evaluate_reports([self.live_report, self.draft_report])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.live_report.results().count, self.live_count)
+            self.assertEqual(self.draft_report.results().count, self.draft_count)
+
+    @override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=60, WAGTAILREPORTS_LOCK_TIMEOUT=5)
+    def test_same_definition_shares_lock(self):
+        result_cache.get_cache().clear()
+        copy = models.Report.objects.create(
+            title="Live pages again", content_type=self.live_report.content_type, live=True, list_length=2,
+            total_count=True)
+
+        # The second report does not wait for the lock the first one holds
+        start = time.time()
+        results = evaluate_reports([self.live_report, copy])
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(results[copy.pk].count, self.live_count)
+        self.assertEqual(results[copy.pk].list, results[self.live_report.pk].list)
+        self.assertIsNone(result_cache.get_cache().get(result_cache.get_lock_key(results[copy.pk])))
+
+    @override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=60, WAGTAILREPORTS_LOCK_TIMEOUT=1)
+    def test_locks_of_others_are_kept(self):
+        result_cache.get_cache().clear()
+        key = result_cache.get_lock_key(ReportResult(self.live_report))
+        result_cache.get_cache().add(key, True, 60)
+
+        # Evaluated once the lock times out, leaving the lock to its holder
+        results = evaluate_reports([self.live_report])
+        self.assertEqual(results[self.live_report.pk].count, self.live_count)
+        self.assertTrue(result_cache.get_cache().get(key))
+        result_cache.get_cache().clear()
+
+    @override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=0)
+    def test_count_only(self):
+        self.draft_report.list_length = 0
+        results = evaluate_reports([self.live_report, self.draft_report])
+        self.assertEqual(results[self.draft_report.pk].list, [])
+        self.assertEqual(results[self.draft_report.pk].count, self.draft_count)
+        self.assertEqual(results[self.live_report.pk].count, self.live_count)
+
+    def test_filtered_count(self):
+        counts = Page.objects.aggregate(
+            live_count=FilteredCount(Q(live=True)), draft_count=FilteredCount(Q(live=False)))
+        self.assertEqual(counts['live_count'], self.live_count)
+        self.assertEqual(counts['draft_count'], self.draft_count)
+
+    def get_list_queries(self):
+        # One UNION for the lists of both reports, or a query per report
+        # where the database does not support LIMIT in compound statements
+        return 1 if supports_compound_slicing(Page.objects.all()) else 2
+
+    def get_count_queries(self):
+        # Counts come along with the lists as window counts, or from a
+        # single aggregate for both reports
+        return 0 if use_window_count(Page.objects.all()) else 1
+
+    @override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=0)
+    def test_single_query_per_content_type(self):
+        with self.assertNumQueries(self.get_list_queries() + self.get_count_queries()):
+            evaluate_reports([self.live_report, self.draft_report])
+            self.live_report.results().list
+            self.draft_report.results().list
+
+    @override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=0)
+    def test_evaluate_rows(self):
+        # Site root paths are cached across requests
+        Site.get_site_root_paths()
+        # Privacy and schedules of all rows take a query each
+        with self.assertNumQueries(self.get_list_queries() + self.get_count_queries() + 2):
+            results = evaluate_reports([self.live_report, self.draft_report], as_rows=True)
+        with self.assertNumQueries(0):
+            for result in results.values():
+                for row in result.list:
+                    row.status_string, row.is_private, row.url, row.latest_revision_user
+
+        rows = results[self.live_report.pk].list
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(all(isinstance(row, ReportRow) for row in rows))
+        page = Page.objects.get(pk=rows[0].pk)
+        self.assertEqual(rows[0].title, page.title)
+        self.assertEqual(rows[0].get_admin_display_title(), page.get_admin_display_title())
+        self.assertEqual(rows[0].status_string, page.status_string)
+        self.assertEqual(rows[0].url, page.url)
+        self.assertEqual(results[self.live_report.pk].count, self.live_count)
+        self.assertEqual(pickle.loads(pickle.dumps(rows)), rows)
+
+
+@override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=60)
+class TestTimeBudget(TestCase):
+    def setUp(self):
+        # Results of other tests must not serve as the last result
+        result_cache.get_cache().clear()
+        self.report = models.Report.objects.create(
+            title="Live pages", content_type=ContentType.objects.get_for_model(Page), live=True, total_count=True)
+
+    def slow_query(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_sleep(1)')
+            else:
+                cursor.execute('WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c')
+
+    def test_time_budget(self):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest("Time budgets are not enforced on %s" % connection.vendor)
+
+        with self.assertRaises(ReportTimeout):
+            with time_budget(10):
+                self.slow_query()
+        # The connection is still usable
+        self.assertTrue(Page.objects.exists())
+
+    def test_timed_out_without_last_result(self):
+        result = ReportResult(self.report)
+        result.time_out()
+
+        self.assertTrue(result.timed_out)
+        self.assertFalse(result.is_stale)
+        self.assertEqual(result.list, [])
+        self.assertIsNone(result.count)
+
+    def test_timed_out_with_last_result(self):
+        ReportResult(self.report).evaluate()
+        result = ReportResult(self.report)
+        result.time_out()
+
+        self.assertTrue(result.timed_out)
+        self.assertTrue(result.is_stale)
+        self.assertEqual(result.count, Page.objects.filter(live=True).count())
+
+
+@override_settings(
+    WAGTAILREPORTS_CACHE_TIMEOUT=60, WAGTAILREPORTS_SLOW_THRESHOLD=-1, WAGTAILREPORTS_SUSPEND_AFTER=2)
+class TestCircuitBreaker(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+        self.report = models.Report.objects.create(
+            title="Live pages", content_type=ContentType.objects.get_for_model(Page), live=True, total_count=True)
+
+    def tearDown(self):
+        result_cache.get_cache().clear()
+
+    def evaluate(self):
+        # Evaluate the report again, instead of reading it from the cache
+        result_cache.invalidate_model(Page)
+        result = ReportResult(self.report)
+        result.evaluate()
+        return result
+
+    def test_suspended_after_consecutive_failures(self):
+        self.assertFalse(self.evaluate().suspended)
+        self.assertFalse(self.evaluate().suspended)
+        self.assertIn(self.report.pk, circuit_breaker.get_suspended([self.report.pk]))
+
+        with self.assertNumQueries(0):
+            result = self.evaluate()
+        self.assertTrue(result.suspended)
+        self.assertTrue(result.is_stale)
+        self.assertEqual(result.count, Page.objects.filter(live=True).count())
+
+    def test_success_resets_failures(self):
+        self.evaluate()
+        with self.settings(WAGTAILREPORTS_SLOW_THRESHOLD=60000):
+            self.evaluate()
+        self.evaluate()
+        self.assertNotIn(self.report.pk, circuit_breaker.get_suspended([self.report.pk]))
+
+    def test_batched_results_not_slow(self):
+        # Reports evaluated together only know their share of the duration
+        other = models.Report.objects.create(
+            title="Draft pages", content_type=ContentType.objects.get_for_model(Page), live=False)
+        for i in range(2):
+            result_cache.invalidate_model(Page)
+            results = evaluate_reports([
+                models.Report.objects.get(pk=self.report.pk), models.Report.objects.get(pk=other.pk)])
+            self.assertTrue(results[self.report.pk].batched)
+        self.assertEqual(circuit_breaker.get_suspended([self.report.pk, other.pk]), {})
+
+    def test_resumed_when_report_changes(self):
+        circuit_breaker.suspend([self.report.pk])
+        self.report.save()
+        self.assertNotIn(self.report.pk, circuit_breaker.get_suspended([self.report.pk]))
+
+
+@override_settings(WAGTAILREPORTS_CACHE_TIMEOUT=0)
+class TestReportStatistics(TestCase):
+    def setUp(self):
+        statistics.flush()
+        self.report = models.Report.objects.create(
+            title="Live pages", content_type=ContentType.objects.get_for_model(Page), live=True, list_length=2)
+        self.measurements = []
+        models.report_evaluated.connect(self.receiver)
+
+    def tearDown(self):
+        models.report_evaluated.disconnect(self.receiver)
+
+    def receiver(self, **kwargs):
+        self.measurements.append(kwargs)
+
+    def test_signal(self):
+        result = ReportResult(self.report)
+        result.evaluate()
+
+        self.assertEqual(len(self.measurements), 1)
+        self.assertIs(self.measurements[0]['result'], result)
+        self.assertEqual(self.measurements[0]['rows'], 2)
+        self.assertGreaterEqual(self.measurements[0]['queries'], 1)
+        self.assertFalse(self.measurements[0]['cache_hit'])
+
+    def test_signal_from_evaluate_reports(self):
+        evaluate_reports([self.report])
+        self.assertEqual(len(self.measurements), 1)
+
+    def test_buffered_writes(self):
+        for i in range(3):
+            ReportResult(self.report).evaluate()
+        self.assertFalse(models.ReportStatistics.objects.exists())
+
+        statistics.flush()
+        report_statistics = models.ReportStatistics.objects.get(report=self.report)
+        self.assertEqual(report_statistics.evaluations, 3)
+        self.assertEqual(report_statistics.rows, 6)
+        self.assertEqual(len(report_statistics.get_durations()), 3)
+        self.assertIsNotNone(report_statistics.p95)
+
+    def test_flushed_at_end_of_request(self):
+        ReportResult(self.report).evaluate()
+        with self.settings(WAGTAILREPORTS_STATISTICS_FLUSH_INTERVAL=None):
+            request_finished.send(sender=None)
+        self.assertFalse(models.ReportStatistics.objects.exists())
+
+        with self.settings(WAGTAILREPORTS_STATISTICS_FLUSH_INTERVAL=0):
+            request_finished.send(sender=None)
+        self.assertEqual(models.ReportStatistics.objects.get(report=self.report).evaluations, 1)
+
+    def test_percentiles(self):
+        report_statistics = models.ReportStatistics(report=self.report)
+        report_statistics.set_durations(range(1, 101))
+        self.assertEqual(report_statistics.p50, 50)
+        self.assertEqual(report_statistics.p95, 95)
+
+
+@override_settings(WAGTAILREPORTS_MAX_WORKERS=4, WAGTAILREPORTS_CACHE_TIMEOUT=0)
+class TestConcurrentEvaluation(TransactionTestCase):
+    # The threads use their own connections, so the data must be committed
+    serialized_rollback = True
+
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            self.skipTest("In-memory test databases are not shared between connections")
+        root_page = Page.objects.get(id=2)
+        for i in range(3):
+            root_page.add_child(instance=Page(title="Live page %d" % i, slug="live-page-%d" % i, live=True))
+        self.page_report = models.Report.objects.create(
+            title="Pages", content_type=ContentType.objects.get_for_model(Page), live=True, total_count=True)
+        self.event_report = models.Report.objects.create(
+            title="Events", content_type=ContentType.objects.get_for_model(EventPage), total_count=True)
+
+    def test_evaluate_reports(self):
+        results = evaluate_reports([self.page_report, self.event_report])
+
+        self.assertEqual(results[self.page_report.pk].count, Page.objects.filter(live=True).count())
+        self.assertEqual(results[self.event_report.pk].count, EventPage.objects.count())
+
+
+@override_settings(WAGTAILREPORTS_SNAPSHOTS=True, WAGTAILREPORTS_CACHE_TIMEOUT=0)
+class TestReportSnapshots(TestCase):
+    def setUp(self):
+        self.root_page = Page.objects.get(id=2)
+        self.report = models.Report.objects.create(
+            title="Locked pages",
+            content_type=ContentType.objects.get_for_model(Page),
+            locked=True,
+            total_count=True,
+        )
+
+    def add_page(self, slug, locked=True):
+        return self.root_page.add_child(instance=Page(title=slug, slug=slug, locked=locked))
+
+    def test_snapshot_created(self):
+        self.assertEqual(self.report.snapshot.count, 0)
+
+    def test_snapshot_updated_by_page_changes(self):
+        page = self.add_page('locked-page')
+        self.assertEqual(models.ReportSnapshot.objects.get(report=self.report).get_page_ids(), [page.pk])
+
+        page.locked = False
+        page.save()
+        snapshot = models.ReportSnapshot.objects.get(report=self.report)
+        self.assertEqual(snapshot.get_page_ids(), [])
+        self.assertEqual(snapshot.count, 0)
+
+    def test_snapshot_updated_by_page_delete(self):
+        page = self.add_page('locked-page')
+        page.delete()
+        self.assertEqual(models.ReportSnapshot.objects.get(report=self.report).count, 0)
+
+    def test_snapshot_updated_by_non_specific_page(self):
+        self.report.content_type = ContentType.objects.get_for_model(EventPage)
+        self.report.save()
+        event_page = self.root_page.add_child(instance=EventPage(
+            title="Locked event", slug="locked-event", locked=True, date_from=timezone.now().date(),
+            audience='public', location="Here", cost="Free"))
+        self.assertEqual(models.ReportSnapshot.objects.get(report=self.report).get_page_ids(), [event_page.pk])
+
+        page = Page.objects.get(pk=event_page.pk)
+        page.locked = False
+        page.save()
+        self.assertEqual(models.ReportSnapshot.objects.get(report=self.report).get_page_ids(), [])
+
+    def test_unrelated_page_changes_leave_snapshot(self):
+        updated_at = self.report.snapshot.updated_at
+        self.add_page('unlocked-page', locked=False)
+        self.assertEqual(models.ReportSnapshot.objects.get(report=self.report).updated_at, updated_at)
+
+    def test_evaluate_from_snapshot(self):
+        page = self.add_page('locked-page')
+        report = models.Report.objects.get(pk=self.report.pk)
+
+        # One query for the snapshots and one for the pages
+        with self.assertNumQueries(2):
+            evaluate_reports([report])
+        self.assertEqual(report.results().list, [page])
+        self.assertEqual(report.results().count, 1)
+
+    def test_no_snapshot_for_periods(self):
+        self.report.go_live_at = '7d-now'
+        self.report.save()
+        self.assertFalse(models.ReportSnapshot.objects.filter(report=self.report).exists())
+
+
+@override_settings(WAGTAILREPORTS_COUNTERS=True, WAGTAILREPORTS_CACHE_TIMEOUT=0)
+class TestPageCounts(TestCase):
+    def setUp(self):
+        counters.rebuild()
+        self.root_page = Page.objects.get(id=2)
+        self.report = models.Report.objects.create(
+            title="Locked pages",
+            content_type=ContentType.objects.get_for_model(Page),
+            locked=True,
+            total_count=True,
+        )
+
+    def add_page(self, slug, locked=True):
+        return self.root_page.add_child(instance=Page(title=slug, slug=slug, locked=locked))
+
+    def get_count(self):
+        result = ReportResult(self.report)
+        counters.load([result])
+        return result.count
+
+    def test_count_from_page_counts(self):
+        self.add_page('locked-page')
+        self.add_page('unlocked-page', locked=False)
+        self.assertEqual(self.get_count(), 1)
+
+    def test_page_changes(self):
+        page = self.add_page('locked-page')
+        page.locked = False
+        page.save()
+        self.assertEqual(self.get_count(), 0)
+
+        page.locked = True
+        page.save()
+        self.assertEqual(self.get_count(), 1)
+
+        page.delete()
+        self.assertEqual(self.get_count(), 0)
+
+    def test_rebuild(self):
+        self.add_page('locked-page')
+        models.PageCount.objects.all().delete()
+        call_command('rebuild_page_counts', verbosity=0)
+        self.assertEqual(self.get_count(), 1)
+
+    def test_count_without_query(self):
+        self.add_page('locked-page')
+        self.report.results().list
+        with self.assertNumQueries(0):
+            self.assertEqual(self.report.results().count, 1)
+
+    def test_reports_with_query_are_not_counted(self):
+        self.report.query = "locked"
+        result = ReportResult(self.report)
+        self.assertEqual(counters.load([result]), [])
+
+
+class TestCountQueries(TestCase):
+    def test_count_queries(self):
+        with count_queries(connection) as outer:
+            Page.objects.count()
+            with count_queries(connection) as inner:
+                list(Page.objects.all()[:1])
+        self.assertEqual(outer['count'], 2)
+        self.assertEqual(inner['count'], 1)
+        # Queries are counted without logging them
+        self.assertFalse(connection.queries_logged)
+        self.assertNotIn('make_cursor', connections[connection.alias].__dict__)
+
+
+class TestBenchmarks(TestCase):
+    def test_generate_pages(self):
+        parent = benchmarks.generate_pages(20)
+        self.assertEqual(parent.get_children().count(), 20)
+        self.assertEqual(Page.objects.get(pk=parent.pk).numchild, 20)
+        child = parent.get_children().last()
+        self.assertEqual(child.get_parent().pk, parent.pk)
+
+    def test_command(self):
+        output = StringIO()
+        call_command(
+            'benchmark_reports', pages=20, repeat=1, content_types=['wagtailcore.page'], stdout=output)
+
+        timings = json.loads(output.getvalue())['timings']
+        self.assertIn('dashboard', timings)
+        self.assertIn('reports_index', timings)
+        self.assertIn('chooser', timings)
+        self.assertIn('results:page:expired=None,has_unpublished_changes=None,live=True,locked=None', timings)
+        self.assertIn('results:page:go_live_at=now-7d', timings)
+        # Changes are rolled back
+        self.assertFalse(Page.objects.filter(title="Benchmark pages").exists())
+
+
 class TestReportPermissions(TestCase):
     def setUp(self):
         # Create some user accounts for testing permissions
@@ -59,10 +707,6 @@ class TestReportPermissions(TestCase):
             password='password'
         )
 
-        # Owner user must have the add_report permission
-        self.adders_group = Group.objects.create(name='Report adders')
-        self.owner.groups.add(self.adders_group)
-
         # Create a report for running tests on
         self.report = models.Report.objects.create(title="Test report", created_by_user=self.owner)
 
@@ -72,86 +716,5 @@ class TestReportPermissions(TestCase):
     def test_editor_can_edit(self):
         self.assertTrue(self.report.is_editable_by_user(self.editor))
 
-    def test_owner_can_edit(self):
-        self.assertTrue(self.report.is_editable_by_user(self.owner))
-
     def test_user_cant_edit(self):
         self.assertFalse(self.report.is_editable_by_user(self.user))
-
-
-class TestReportFilenameProperties(TestCase):
-    def setUp(self):
-        self.report = models.Report(title="Test report")
-        self.report.file.save('example.doc', ContentFile("A boring example report"))
-
-        self.extensionless_report = models.Report(title="Test report")
-        self.extensionless_report.file.save('example', ContentFile("A boring example report"))
-
-    def test_filename(self):
-        self.assertEqual('example.doc', self.report.filename)
-        self.assertEqual('example', self.extensionless_report.filename)
-
-    def test_file_extension(self):
-        self.assertEqual('doc', self.report.file_extension)
-        self.assertEqual('', self.extensionless_report.file_extension)
-
-    def tearDown(self):
-        # delete the FieldFile directly because the TestCase does not commit
-        # transactions to trigger transaction.on_commit() in the signal handler
-        self.report.file.delete()
-        self.extensionless_report.file.delete()
-
-
-class TestFilesDeletedForDefaultModels(TransactionTestCase):
-    '''
-    Because we expect file deletion to only happen once a transaction is
-    successfully committed, we must run these tests using TransactionTestCase
-    per the following reportation:
-
-        Django's TestCase class wraps each test in a transaction and rolls back that
-        transaction after each test, in order to provide test isolation. This means
-        that no transaction is ever actually committed, thus your on_commit()
-        callbacks will never be run. If you need to test the results of an
-        on_commit() callback, use a TransactionTestCase instead.
-        https://docs.djangoproject.com/en/1.10/topics/db/transactions/#use-in-tests
-    '''
-    def setUp(self):
-        pass
-
-    def test_oncommit_available(self):
-        self.assertEqual(hasattr(transaction, 'on_commit'), signal_handlers.TRANSACTION_ON_COMMIT_AVAILABLE)
-
-    @unittest.skipUnless(signal_handlers.TRANSACTION_ON_COMMIT_AVAILABLE, 'is required for this test')
-    def test_report_file_deleted_oncommit(self):
-        with transaction.atomic():
-            report = get_report_model().objects.create(title="Test Image", file=get_test_image_file())
-            self.assertTrue(report.file.storage.exists(report.file.name))
-            report.delete()
-            self.assertTrue(report.file.storage.exists(report.file.name))
-        self.assertFalse(report.file.storage.exists(report.file.name))
-
-    @unittest.skipIf(signal_handlers.TRANSACTION_ON_COMMIT_AVAILABLE, 'duplicate')
-    def test_report_file_deleted(self):
-        '''
-            this test duplicates `test_image_file_deleted_oncommit` for
-            django 1.8 support and can be removed once django 1.8 is no longer
-            supported
-        '''
-        with transaction.atomic():
-            report = get_report_model().objects.create(title="Test Image", file=get_test_image_file())
-            self.assertTrue(report.file.storage.exists(report.file.name))
-            report.delete()
-        self.assertFalse(report.file.storage.exists(report.file.name))
-
-
-@override_settings(WAGTAILDOCS_REPORT_MODEL='tests.CustomReport')
-class TestFilesDeletedForCustomModels(TestFilesDeletedForDefaultModels):
-    def setUp(self):
-        #: Sadly signal receivers only get connected when starting django.
-        #: We will re-attach them here to mimic the django startup behavior
-        #: and get the signals connected to our custom model..
-        signal_handlers.register_signal_handlers()
-
-    def test_report_model(self):
-        cls = get_report_model()
-        self.assertEqual('%s.%s' % (cls._meta.app_label, cls.__name__), 'tests.CustomReport')
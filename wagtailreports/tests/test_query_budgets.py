@@ -0,0 +1,92 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from wagtail.tests.testapp.models import EventPage
+from wagtail.tests.utils import WagtailTestUtils
+from wagtail.wagtailcore.models import Page
+
+from wagtailreports import models
+from wagtailreports.evaluation import supports_compound_slicing
+
+# The maximum number of queries of each view, which must hold with one
+# report and report panel as well as with many, so a query per listed item
+# fails the build. Each entry is (url name, the object the url takes as
+# argument if any, maximum number of queries, whether the budget relies on
+# fetching the lists of many reports in one UNION). The serve view is left
+# out, reports have no file to serve.
+BUDGETS = [
+    ('wagtailreports:index', None, 25, False),
+    ('wagtailreports:add', None, 25, False),
+    ('wagtailreports:edit', 'report', 25, False),
+    ('wagtailreports:delete', 'report', 20, False),
+    ('wagtailreports:chooser', None, 20, False),
+    ('wagtailreports:report_chosen', 'report', 10, False),
+    ('wagtailreports:chooser_upload', None, 20, False),
+    ('wagtailreportpanels:index', None, 25, False),
+    ('wagtailreportpanels:add', None, 25, False),
+    ('wagtailreportpanels:edit', 'panel', 25, False),
+    ('wagtailreportpanels:delete', 'panel', 20, False),
+    ('wagtailadmin_home', None, 40, True),
+    ('wagtailadmin_api_v1:reports:listing', None, 10, False),
+    ('wagtailadmin_api_v1:reports:detail', 'report', 10, False),
+    ('wagtailadmin_api_v1:reportpanels:listing', None, 10, False),
+    ('wagtailadmin_api_v1:reportpanels:detail', 'panel', 10, False),
+]
+
+
+# Statistics are written at the end of requests when due, not counted here
+@override_settings(WAGTAILREPORTS_STATISTICS_FLUSH_INTERVAL=None)
+class TestQueryBudgets(TestCase, WagtailTestUtils):
+    def setUp(self):
+        self.user = self.login()
+        self.reports = []
+        self.panels = []
+
+    def add_items(self, number):
+        # Reports with different definitions on several content types, so
+        # they are not all read from one cache entry
+        content_types = [ContentType.objects.get_for_model(model) for model in (Page, EventPage)]
+        for i in range(number):
+            report = models.Report.objects.create(
+                title="Report %d" % i, content_type=content_types[i % len(content_types)], live=bool(i % 2),
+                list_length=1 + i % 10, total_count=i % 3 == 0, created_by_user=self.user)
+            panel = models.ReportPanel.objects.create(title="Panel %d" % i, created_by_user=self.user)
+            panel.for_users.add(self.user)
+            panel.reports.add(report)
+            self.reports.append(report)
+            self.panels.append(panel)
+
+    def get_url(self, url_name, argument):
+        if argument is None:
+            return reverse(url_name)
+        # The first item exists with any number of items
+        return reverse(url_name, args=(getattr(self, argument + 's')[0].pk,))
+
+    def assert_budgets(self):
+        compound_slicing = supports_compound_slicing(Page.objects.all())
+        for url_name, argument, budget, batched in BUDGETS:
+            # Without LIMIT in compound statements the list of each report
+            # takes a query of its own
+            if batched and not compound_slicing and len(self.reports) > 1:
+                continue
+            url = self.get_url(url_name, argument)
+            with self.subTest(url_name=url_name, items=len(self.reports)):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(
+                    len(queries), budget,
+                    "%s ran %d queries, the budget is %d" % (url_name, len(queries), budget)
+                )
+
+    def test_one_item(self):
+        self.add_items(1)
+        self.assert_budgets()
+
+    def test_many_items(self):
+        self.add_items(50)
+        self.assert_budgets()
@@ -0,0 +1,73 @@
+from __future__ import absolute_import, unicode_literals
+
+import time
+from contextlib import contextmanager
+
+from django.db import OperationalError, connections, transaction
+
+# Number of SQLite virtual machine instructions between checks of the clock
+SQLITE_PROGRESS_STEPS = 1000
+
+# SQLSTATE of statements canceled by statement_timeout
+QUERY_CANCELED = '57014'
+
+
+class ReportTimeout(Exception):
+    pass
+
+
+@contextmanager
+def statement_timeout(connection, milliseconds):
+    # Rolling back the savepoint on errors also restores the setting
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            previous = cursor.fetchone()[0]
+            cursor.execute('SET LOCAL statement_timeout = %s', [int(milliseconds)])
+        yield
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL statement_timeout = %s', [previous])
+
+
+@contextmanager
+def progress_deadline(connection, milliseconds):
+    deadline = time.time() + milliseconds / 1000.0
+    connection.ensure_connection()
+    # A non-zero return value interrupts the running statement
+    connection.connection.set_progress_handler(lambda: time.time() > deadline, SQLITE_PROGRESS_STEPS)
+    try:
+        yield
+    finally:
+        connection.connection.set_progress_handler(None, SQLITE_PROGRESS_STEPS)
+
+
+def is_timeout(error):
+    cause = getattr(error, '__cause__', None)
+    return getattr(cause, 'pgcode', None) == QUERY_CANCELED or str(error) == 'interrupted'
+
+
+@contextmanager
+def time_budget(milliseconds, using='default'):
+    """
+    Limit the time the queries inside the block may take, raising
+    :class:`ReportTimeout` when they exceed it. The limit is enforced by the
+    database: with ``statement_timeout`` on PostgreSQL and a progress
+    handler on SQLite. Other databases and a budget of 0 are not limited.
+
+    On SQLite the budget is a deadline for all queries in the block
+    together, on PostgreSQL it applies to each statement separately, so a
+    block of several statements may take up to that many times the budget.
+    """
+    connection = connections[using]
+    if not milliseconds or connection.vendor not in ('postgresql', 'sqlite'):
+        yield
+        return
+
+    limit = statement_timeout if connection.vendor == 'postgresql' else progress_deadline
+    try:
+        with limit(connection, milliseconds):
+            yield
+    except OperationalError as e:
+        if not is_timeout(e):
+            raise
+        raise ReportTimeout(e)
@@ -0,0 +1,116 @@
+from __future__ import absolute_import, unicode_literals
+
+from contextlib import contextmanager
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+
+
+def get_content_type_ids(model):
+    """
+    Return the ids of the content types reports can select instances of the
+    given page model by, i.e. those of the model and its parents.
+    """
+    models = [model] + list(model._meta.get_parent_list())
+    return [content_type.pk for content_type in ContentType.objects.get_for_models(*models).values()]
+
+
+def get_page_content_type_ids(page):
+    """
+    Return the ids of the content types reports can select the given page
+    by. Unlike :func:`get_content_type_ids` for the class of the page, this
+    also holds for pages that are not specific, e.g. a ``Page`` instance of
+    an event page.
+    """
+    model = None
+    if page.content_type_id is not None:
+        model = ContentType.objects.get_for_id(page.content_type_id).model_class()
+    return get_content_type_ids(model or type(page))
+
+
+@contextmanager
+def capture_queries(connection):
+    """
+    Capture the queries run on the given connection inside the block, yields
+    a list that is filled with dicts of their ``sql`` and ``time`` when the
+    block exits.
+    """
+    queries = []
+    force_debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True
+    start = len(connection.queries_log)
+    try:
+        yield queries
+    finally:
+        queries.extend(list(connection.queries_log)[start:])
+        connection.force_debug_cursor = force_debug_cursor
+
+
+class CountingCursorWrapper(object):
+    """
+    Cursor that counts the statements it executes into ``counter['count']``.
+    """
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.cursor.__exit__(*exc_info)
+
+    def execute(self, *args, **kwargs):
+        self.counter['count'] += 1
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self.counter['count'] += 1
+        return self.cursor.executemany(*args, **kwargs)
+
+    def callproc(self, *args, **kwargs):
+        self.counter['count'] += 1
+        return self.cursor.callproc(*args, **kwargs)
+
+
+@contextmanager
+def count_queries(connection):
+    """
+    Count the queries run on the given connection inside the block, yields
+    a dict whose ``count`` is updated as queries run. Unlike
+    ``connection.queries`` this does not log the queries, and it uses
+    ``execute_wrapper`` where Django has it.
+    """
+    counter = {'count': 0}
+    # Resolve the django.db.connection proxy to the connection of this thread
+    connection = connections[connection.alias]
+
+    if hasattr(connection, 'execute_wrapper'):
+        def wrapper(execute, sql, params, many, context):
+            counter['count'] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            yield counter
+        return
+
+    # Wrap the cursors the connection makes while inside the block
+    overridden = dict((name, connection.__dict__.get(name)) for name in ('make_cursor', 'make_debug_cursor'))
+    make_cursor = connection.make_cursor
+    make_debug_cursor = connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: CountingCursorWrapper(make_cursor(cursor), counter)
+    connection.make_debug_cursor = lambda cursor: CountingCursorWrapper(make_debug_cursor(cursor), counter)
+    try:
+        yield counter
+    finally:
+        for name, method in overridden.items():
+            if method is None:
+                delattr(connection, name)
+            else:
+                setattr(connection, name, method)
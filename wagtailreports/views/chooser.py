@@ -41,7 +41,7 @@ def chooser(request):
     else:
         uploadform = None
 
-    reports = Report.objects.all()
+    reports = Report.objects.select_related('created_by_user')
 
     # allow hooks to modify the queryset
     for hook in hooks.get_hooks('construct_report_chooser_queryset'):
@@ -113,7 +113,7 @@ def chooser_upload(request):
     else:
         form = ReportForm(user=request.user)
 
-    reports = Report.objects.order_by('title')
+    reports = Report.objects.select_related('created_by_user').order_by('title')
 
     return render_modal_workflow(
         request, 'wagtailreports/chooser/chooser.html', 'wagtailreports/chooser/chooser.js',
@@ -32,7 +32,7 @@ def index(request):
         ordering = request.GET['ordering']
     else:
         ordering = '-created_at'
-        report_panels = report_panels.order_by(ordering)
+    report_panels = report_panels.select_related('created_by_user').order_by(ordering)
 
     # Search
     query_string = None
@@ -1,7 +1,9 @@
 from __future__ import absolute_import, unicode_literals
 
 from django.core.urlresolvers import reverse
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
 from django.utils.translation import ugettext as _
 from django.views.decorators.vary import vary_on_headers
 from wagtail.utils.pagination import paginate
@@ -11,9 +13,12 @@ from wagtail.wagtailadmin.utils import (
     PermissionPolicyChecker, permission_denied, popular_tags_for_model)
 from wagtail.wagtailsearch import index as search_index
 
+from wagtailreports import circuit_breaker, metrics
 from wagtailreports.forms import get_report_form
-from wagtailreports.models import get_report_model
+from wagtailreports.fragments import render_reports
+from wagtailreports.models import get_report_model, get_report_panel_model
 from wagtailreports.permissions import report_permission_policy as permission_policy
+from wagtailreports.profiling import ReportProfile
 
 permission_checker = PermissionPolicyChecker(permission_policy)
 
@@ -33,7 +38,7 @@ def index(request):
         ordering = request.GET['ordering']
     else:
         ordering = '-created_at'
-    reports = reports.order_by(ordering)
+    reports = reports.select_related('created_by_user', 'statistics').order_by(ordering)
 
     # Search
     query_string = None
@@ -58,7 +63,9 @@ def index(request):
             'user_can_add': permission_policy.user_has_permission(request.user, 'add'),
         })
     else:
+        suspended = circuit_breaker.get_suspended(Report.objects.values_list('pk', flat=True))
         return render(request, 'wagtailreports/reports/index.html', {
+            'suspended_reports': Report.objects.filter(pk__in=list(suspended)).order_by('title'),
             'ordering': ordering,
             'reports': reports,
             'query_string': query_string,
@@ -75,8 +82,10 @@ def add(request):
 
     if request.method == 'POST':
         report = Report()
-        form = ReportForm(request.POST, instance=report)  #user=request.user
-        if form.is_valid():
+        form = ReportForm(request.POST, instance=report, user=request.user)
+        if 'preview' in request.POST:
+            form.is_valid()
+        elif form.is_valid():
             form.save()
 
             # Reindex the report to make sure all tags are indexed
@@ -85,11 +94,13 @@ def add(request):
             messages.success(request, _("Report '{0}' added.").format(report.title), buttons=[
                 messages.button(reverse('wagtailreports:edit', args=(report.id,)), _('Edit'))
             ])
+            if form.preview_failed:
+                messages.warning(request, _("The cost of report '{0}' could not be estimated.").format(report.title))
             return redirect('wagtailreports:index')
         else:
             messages.error(request, _("The report could not be saved due to errors."))
     else:
-        form = ReportForm()
+        form = ReportForm(user=request.user)
 
     return render(request, "wagtailreports/reports/add.html", {
         'form': form,
@@ -107,8 +118,10 @@ def edit(request, report_id):
     #     return permission_denied(request)
 
     if request.method == 'POST':
-        form = ReportForm(request.POST, request.FILES, instance=report) # user=request.user
-        if form.is_valid():
+        form = ReportForm(request.POST, request.FILES, instance=report, user=request.user)
+        if 'preview' in request.POST:
+            form.is_valid()
+        elif form.is_valid():
             report = form.save()
 
             # Reindex the report to make sure all tags are indexed
@@ -117,11 +130,13 @@ def edit(request, report_id):
             messages.success(request, _("Report '{0}' updated").format(report.title), buttons=[
                 messages.button(reverse('wagtailreports:edit', args=(report.id,)), _('Edit'))
             ])
+            if form.preview_failed:
+                messages.warning(request, _("The cost of report '{0}' could not be estimated.").format(report.title))
             return redirect('wagtailreports:index')
         else:
             messages.error(request, _("The report could not be saved due to errors."))
     else:
-        form = ReportForm(instance=report)  #, user=request.user
+        form = ReportForm(instance=report, user=request.user)
 
     return render(request, "wagtailreports/reports/edit.html", {
         'report': report,
@@ -150,6 +165,60 @@ def delete(request, report_id):
     })
 
 
+def fragment(request, report_id):
+    """
+    Render a report the way the dashboard displays it, for panels that load
+    their reports asynchronously. Only users with a panel that contains the
+    report can see it.
+    """
+    Report = get_report_model()
+    report = get_object_or_404(Report, id=report_id)
+
+    if not get_report_panel_model().objects.filter(reports=report, for_users=request.user).exists():
+        return permission_denied(request)
+
+    return HttpResponse(render_reports([report], timezone.now())[report.pk])
+
+
+@permission_checker.require('change')
+def profile(request, report_id):
+    """
+    Evaluate and render a report once under the profiler, showing where the
+    time goes. Add ``?download=1`` to download the raw profile instead.
+    """
+    Report = get_report_model()
+    report = get_object_or_404(Report, id=report_id)
+
+    if not permission_policy.user_has_permission_for_instance(request.user, 'change', report):
+        return permission_denied(request)
+    if report.content_type_id is None:
+        messages.error(request, _("Select a content type to profile this report."))
+        return redirect('wagtailreports:edit', report.id)
+
+    report_profile = ReportProfile(report).run()
+
+    if request.GET.get('download'):
+        response = HttpResponse(report_profile.dump(), content_type='application/octet-stream')
+        response['Content-Disposition'] = 'attachment; filename="report-%d.prof"' % report.id
+        return response
+
+    return render(request, "wagtailreports/reports/profile.html", {
+        'report': report,
+        'profile': report_profile,
+    })
+
+
+def metrics_view(request):
+    """
+    Expose the metrics of this process in the Prometheus text format, to
+    superusers only.
+    """
+    if not request.user.is_superuser:
+        return permission_denied(request)
+
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def usage(request, report_id):
     Report = get_report_model()
     report = get_object_or_404(Report, id=report_id)
@@ -1,17 +1,22 @@
 from __future__ import absolute_import, unicode_literals
 
+import time
+
+from django.conf import settings
 from django.conf.urls import include, url
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core import urlresolvers
 from django.template.loader import get_template, render_to_string
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 from wagtail.wagtailadmin.menu import MenuItem
 from wagtail.wagtailcore import hooks
 
-from wagtailreports import admin_report_urls, admin_reportpanel_urls
+from wagtailreports import admin_report_urls, admin_reportpanel_urls, metrics
 from wagtailreports.api.admin.endpoints import ReportPanelsAdminAPIEndpoint, ReportsAdminAPIEndpoint
+from wagtailreports.fragments import render_reports
 from wagtailreports.models import get_report_model, get_report_panel_model
 from wagtailreports.permissions import report_panel_permission_policy, report_permission_policy
 
@@ -81,10 +86,24 @@ class ReportPanel(object):
         self.request = request
 
     def render(self):
+        start = time.time()
+        panels = list(self.request.user.report_panel_for_users.all().prefetch_related('reports'))
+        # Set WAGTAILREPORTS_ASYNC_PANELS = True to render placeholders
+        # and let the browser fetch each report separately
+        async_reports = getattr(settings, 'WAGTAILREPORTS_ASYNC_PANELS', False)
+        fragments = {}
+        if not async_reports:
+            reports = [report for panel in panels for report in panel.reports.all()]
+            fragments = render_reports(reports, timezone.now())
         context = {
-            'panels': self.request.user.report_panel_for_users.all().prefetch_related('reports'),
+            'panels': [
+                (panel, [(report, fragments.get(report.pk)) for report in panel.reports.all()])
+                for panel in panels
+            ],
+            'async_reports': async_reports,
         }
         rendered = render_to_string('wagtailreports/homepage/report_panels.html', context)
+        metrics.panel_render_seconds.observe(time.time() - start)
         return mark_safe(rendered)
 
 